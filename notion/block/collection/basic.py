@@ -1,17 +1,33 @@
-from typing import Optional
+import uuid
+from copy import deepcopy
+from itertools import islice
+from typing import Callable, Optional, Iterable, List
 
 from notion.block.basic import PageBlock, Block
 from notion.block.children import Templates
+from notion.block.collection.common import NotionDate
+from notion.block.collection.materialized import MaterializedView
 from notion.block.collection.media import CollectionViewBlock
 from notion.block.collection.query import CollectionQuery
 from notion.block.collection.view import CalendarView
 from notion.converter import PythonToNotionConverter, NotionToPythonConverter
 from notion.maps import markdown_field_map, field_map
+from notion.settings import QUERY_PAGE_SIZE
 from notion.utils import (
     slugify,
 )
 
 
+def _to_hashable(value):
+    if isinstance(value, list):
+        return tuple(_to_hashable(v) for v in value)
+
+    if isinstance(value, NotionDate):
+        return value.start, value.end
+
+    return getattr(value, "id", value)
+
+
 class CollectionBlock(Block):
     """
     Collection Block.
@@ -52,6 +68,54 @@ class CollectionBlock(Block):
         assert len(parent.views) > 0
         return parent.views[0]
 
+    def _get_schema_index(self) -> dict:
+        """
+        Get the lookup tables for schema properties of this collection.
+
+        They are shared by all instances of this collection and
+        dropped by the record store whenever the collection record changes.
+        """
+        schema = self.get("schema") or {}
+        indexes = self._client._store._schema_indexes
+        index = indexes.get(self.id)
+
+        if index and index["schema"] is schema:
+            return index
+
+        properties = []
+        by_id, by_slug, by_name = {}, {}, {}
+        title = None
+
+        for prop_id, item in schema.items():
+            prop = {"id": prop_id, "slug": slugify(item["name"]), **item}
+            properties.append(prop)
+            by_id[prop_id] = prop
+            by_slug.setdefault(prop["slug"], prop)
+            by_name.setdefault(item["name"], prop)
+            if title is None and "title" in (prop_id, prop["slug"], prop["type"]):
+                title = prop
+
+        index = {
+            "schema": schema,
+            "properties": properties,
+            "by_id": by_id,
+            "by_slug": by_slug,
+            "by_name": by_name,
+            "title": title,
+        }
+        indexes[self.id] = index
+        return index
+
+    def _get_row_reader(self) -> "CollectionRowReader":
+        """
+        Get the row reader compiled for the current version of the schema.
+        """
+        index = self._get_schema_index()
+        if "reader" not in index:
+            index["reader"] = CollectionRowReader(index["properties"])
+
+        return index["reader"]
+
     def get_schema_properties(self) -> list:
         """
         Fetch a flattened list of all properties in the collection's schema.
@@ -62,13 +126,7 @@ class CollectionBlock(Block):
         list
             All properties.
         """
-        properties = []
-
-        for block_id, item in self.get("schema").items():
-            slug = slugify(item["name"])
-            properties.append({"id": block_id, "slug": slug, **item})
-
-        return properties
+        return list(self._get_schema_index()["properties"])
 
     def get_schema_property(self, identifier: str) -> Optional[dict]:
         """
@@ -90,13 +148,61 @@ class CollectionBlock(Block):
         dict, optional
             Schema of the property if found, or None.
         """
-        for prop in self.get_schema_properties():
-            if identifier == prop["id"] or slugify(identifier) == prop["slug"]:
-                return prop
-            if identifier == "title" and prop["type"] == "title":
-                return prop
+        index = self._get_schema_index()
+
+        if identifier == "title":
+            return index["title"]
+
+        for key, lookup in (
+            ("by_id", identifier),
+            ("by_slug", identifier),
+            ("by_name", identifier),
+            ("by_slug", slugify(identifier)),
+        ):
+            if lookup in index[key]:
+                return index[key][lookup]
+
         return None
 
+    def _get_pending_schema_options(self, prop_id: str) -> list:
+        pending = getattr(self._client, "_pending_schema_options", {})
+        return pending.get(self.id, {}).get(prop_id, [])
+
+    def _get_schema_with_options(self, options: dict) -> dict:
+        schema = deepcopy(self.get("schema"))
+
+        for prop_id, new_options in options.items():
+            prop_options = schema[prop_id].setdefault("options", [])
+            existing = {o["value"].lower() for o in prop_options}
+            prop_options += [
+                o for o in new_options if o["value"].lower() not in existing
+            ]
+
+        return schema
+
+    def add_schema_options(self, prop_id: str, options: list):
+        """
+        Add new options to the select or multi select property.
+
+        When in transaction the options are collected and written
+        in a single schema update per collection when it's submitted.
+
+
+        Arguments
+        ---------
+        prop_id : str
+            ID of the property.
+
+        options : list
+            List of option dicts with "id", "value" and "color" keys.
+        """
+        if self._client.in_transaction():
+            pending = self._client._pending_schema_options.setdefault(self.id, {})
+            pending.setdefault(prop_id, []).extend(options)
+            return
+
+        self.set("schema", self._get_schema_with_options({prop_id: options}))
+
     def add_row(self, update_views=True, **kwargs) -> "CollectionRowBlock":
         """
         Create a new empty CollectionRowBlock
@@ -130,25 +236,294 @@ class CollectionBlock(Block):
                 setattr(row, key, val)
             if update_views:
                 # make sure the new record is inserted at the end of each view
-                for view in self.parent.views:
-                    # TODO: why we skip CalendarView? can we remove that 'if'?
-                    if not view or isinstance(view, CalendarView):
-                        continue
-                    view.set("page_sort", view.get("page_sort", []) + [row_id])
+                for view in self._get_sortable_views():
+                    self._append_to_view(view, row_id)
+
+        return row
+
+    def add_rows(
+        self, rows: Iterable[dict], update_views: bool = True, batch_size: int = 100
+    ) -> List["CollectionRowBlock"]:
+        """
+        Create many new CollectionRowBlocks under this collection
+        at once, and return the instances.
+
+        Rows are sent in transactions of `batch_size` rows each,
+        with each row created already with all of its properties.
+
+
+        Arguments
+        ---------
+        rows : Iterable[dict]
+            Pairs of keys and values set in each newly
+            created CollectionRowBlock, like in `add_row`.
+
+        update_views : bool, optional
+            Whether or not to update the views after
+            adding the rows to Collection.
+            Defaults to True.
+
+        batch_size : int, optional
+            Max number of rows sent in one transaction.
+            Defaults to 100.
+
+
+        Returns
+        -------
+        list of CollectionRowBlock
+            Added rows.
+        """
+        views = self._get_sortable_views() if update_views else []
+        rows = iter(rows)
+        added = []
+
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+
+            batch_rows = []
+            try:
+                with self._client.as_atomic_transaction():
+                    for kwargs in batch:
+                        row = self._add_row_in_transaction(kwargs)
+                        batch_rows.append(row)
+                        for view in views:
+                            self._append_to_view(view, row.id)
+
+            except Exception:
+                # drop the rows materialized locally if they weren't created
+                for row in batch_rows:
+                    self._client._store._remove_record("block", row.id)
+                raise
+
+            added += batch_rows
+
+        return added
+
+    def upsert_rows(
+        self,
+        rows: Iterable[dict],
+        key: str,
+        add_missing: bool = True,
+        update_views: bool = True,
+        batch_size: int = 100,
+        local: bool = False,
+    ) -> dict:
+        """
+        Update rows matched by the value of the `key` property
+        and create the ones which don't exist yet.
+
+        Only properties whose converted value differs from
+        the one already stored are sent, in transactions
+        of `batch_size` rows each.
+
+
+        Arguments
+        ---------
+        rows : Iterable[dict]
+            Pairs of property names and values for each row,
+            each one must contain the `key` property.
+
+        key : str
+            ID, slug or name of the property used to match the rows.
+
+        add_missing : bool, optional
+            Whether or not to add rows which weren't matched.
+            Defaults to True.
+
+        update_views : bool, optional
+            Whether or not to update the views after
+            adding the missing rows to Collection.
+            Defaults to True.
+
+        batch_size : int, optional
+            Max number of rows sent in one transaction.
+            Defaults to 100.
+
+        local : bool, optional
+            Whether or not to match only against rows already cached
+            in the local record store, without asking the server.
+            Defaults to False.
+
+
+        Returns
+        -------
+        dict
+            Lists of "added" and "updated" CollectionRowBlocks.
+        """
+        key_prop = self.get_schema_property(key)
+        if key_prop is None:
+            raise AttributeError(f"Unknown property: '{key}'")
+
+        if local:
+            row_ids = self._client._store.get_cached_collection_rows(self.id)
+        else:
+            row_ids = self._get_all_rows()._get_row_ids()
+
+        existing = {}
+        for row_id in row_ids:
+            row = CollectionRowBlock(self._client, row_id)
+            value = row.get(f"properties.{key_prop['id']}")
+            value = row._convert_notion_to_python(value, key_prop)
+            existing.setdefault(_to_hashable(value), row)
+
+        missing = []
+        updated = []
+        rows = iter(rows)
+
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+
+            with self._client.as_atomic_transaction():
+                for kwargs in batch:
+                    row = existing.get(_to_hashable(kwargs[key]))
+                    if row is None:
+                        missing.append(kwargs)
+                    elif self._update_row_in_transaction(row, kwargs):
+                        updated.append(row)
+
+        added = []
+        if add_missing:
+            added = self.add_rows(missing, update_views, batch_size)
+
+        return {"added": added, "updated": updated}
+
+    def _update_row_in_transaction(self, row, kwargs: dict) -> bool:
+        properties = row.get("properties") or {}
+        changed = False
+
+        for name, val in kwargs.items():
+            prop = self.get_schema_property(name)
+            if prop is None:
+                # same as in `_add_row_in_transaction`
+                if getattr(row, name, None) != val:
+                    setattr(row, name, val)
+                    changed = True
+                continue
+
+            path, value = PythonToNotionConverter.convert(
+                name=name, value=val, prop=prop, block=row
+            )
+            if properties.get(prop["id"]) == value:
+                continue
+
+            changed = True
+            self._client.build_and_submit_transaction(
+                record_id=row.id, path=path, args=value, command="set"
+            )
+
+        return changed
+
+    def _add_row_in_transaction(self, kwargs: dict) -> "CollectionRowBlock":
+        row_id = str(uuid.uuid4())
+
+        # materialize the row in the local store right away,
+        # so it can be used by the converters before it's created
+        self._client._store._update_record(
+            table="block",
+            record_id=row_id,
+            value={
+                "id": row_id,
+                "type": "page",
+                "alive": True,
+                "parent_id": self.id,
+                "parent_table": self._table,
+            },
+        )
+        row = CollectionRowBlock(self._client, row_id)
+
+        try:
+            properties = {}
+            extra = {}
+            for key, val in kwargs.items():
+                prop = self.get_schema_property(key)
+                if prop is None:
+                    extra[key] = val
+                    continue
+
+                path, value = PythonToNotionConverter.convert(
+                    name=key, value=val, prop=prop, block=row
+                )
+                properties[prop["id"]] = value
+
+            self._client.create_record(
+                "block", self, record_id=row_id, type="page", properties=properties
+            )
+
+            # these have to go after the record is created, not to be overwritten
+            for key, val in extra.items():
+                setattr(row, key, val)
+
+        except Exception:
+            self._client._store._remove_record("block", row_id)
+            raise
 
         return row
 
-    def query(self, **kwargs):
+    def _get_sortable_views(self) -> list:
+        # TODO: why we skip CalendarView? can we remove that 'if'?
+        views = self.parent.views
+        return [v for v in views if v and not isinstance(v, CalendarView)]
+
+    def _append_to_view(self, view, row_id: str):
+        self._client.build_and_submit_transaction(
+            record_id=view.id,
+            path="page_sort",
+            args={"id": row_id},
+            command="listAfter",
+            table=view._table,
+        )
+
+    def query(self, local: bool = False, **kwargs):
         """
         Run a query inline and return the results.
 
 
+        Arguments
+        ---------
+        local : bool, optional
+            Whether or not to evaluate the query against the rows
+            already cached in the local record store.
+            Defaults to False.
+
+
         Returns
         -------
         CollectionQueryResult
             Result of passed query.
         """
-        return CollectionQuery(self, self._get_a_collection_view(), **kwargs).execute()
+        query = CollectionQuery(self, self._get_a_collection_view(), **kwargs)
+        return query.execute(local=local)
+
+    def materialize(
+        self, group_by: str = None, callback: Callable = None, **kwargs
+    ) -> MaterializedView:
+        """
+        Evaluate the query against the rows cached in the local record store
+        and keep the result up to date as the rows change, see `MaterializedView`.
+
+
+        Arguments
+        ---------
+        group_by : str, optional
+            ID, slug or name of a property to group the rows by.
+            Defaults to None.
+
+        callback : Callable, optional
+            Called with the view after each change of its rows.
+            Defaults to None.
+
+
+        Returns
+        -------
+        MaterializedView
+            View which follows the changes of the collection.
+        """
+        query = CollectionQuery(self, self._get_a_collection_view(), **kwargs)
+        return MaterializedView(query, group_by=group_by, callback=callback)
 
     def get_rows(self, **kwargs):
         """
@@ -162,6 +537,112 @@ class CollectionBlock(Block):
         """
         return self.query(**kwargs)
 
+    def _get_all_rows(self, local: bool = False):
+        # paged, so the rows past the QUERY_LIMIT of one request are included
+        query = CollectionQuery(self, self._get_a_collection_view())
+        return query.execute(page_size=QUERY_PAGE_SIZE, local=local)
+
+    def iter_rows(self, page_size: int = QUERY_PAGE_SIZE, **kwargs):
+        """
+        Lazily iterate over all rows from a collection,
+        fetching them page by page.
+
+
+        Arguments
+        ---------
+        page_size : int, optional
+            Number of rows to fetch per request.
+            Defaults to QUERY_PAGE_SIZE.
+
+
+        Returns
+        -------
+        Iterator[CollectionRowBlock]
+            All rows.
+        """
+        query = CollectionQuery(self, self._get_a_collection_view(), **kwargs)
+        return query.iter_rows(page_size=page_size)
+
+    def aggregate(
+        self,
+        aggregations: list,
+        group_by: str = None,
+        date_bucket: str = "day",
+        local: bool = False,
+    ) -> dict:
+        """
+        Compute statistics over all rows with batched array operations,
+        without instantiating a CollectionRowBlock per row.
+
+
+        Arguments
+        ---------
+        aggregations : list
+            List of dicts with "id", "property" and "aggregator" keys,
+            for example {"id": "p90", "property": "estimate",
+            "aggregator": "percentile", "percentile": 90}.
+
+        group_by : str, optional
+            ID, slug or name of a select, multi select, person,
+            checkbox or date property to group the rows by.
+            Defaults to None.
+
+        date_bucket : str, optional
+            One of "day", "week", "month" or "year",
+            used when grouping by a date property.
+            Defaults to "day".
+
+        local : bool, optional
+            Whether or not to aggregate only rows already cached
+            in the local record store, without asking the server.
+            Defaults to False.
+
+
+        Returns
+        -------
+        dict
+            Results keyed by aggregation ID, or by group value and then ID.
+        """
+        rows = self._get_all_rows(local)
+        return rows.aggregate(aggregations, group_by, date_bucket)
+
+    def to_columns(self, properties: list = None, local: bool = False) -> dict:
+        """
+        Export all rows as typed columns, NumPy arrays for numbers,
+        checkboxes and dates and categorical codes for selects.
+
+
+        Arguments
+        ---------
+        properties : list, optional
+            IDs, slugs or names of properties to export.
+            Defaults to all properties except formulas and rollups.
+
+        local : bool, optional
+            Whether or not to export only rows already cached
+            in the local record store, without asking the server.
+            Defaults to False.
+
+
+        Returns
+        -------
+        dict
+            Columns keyed by property slug.
+        """
+        return self._get_all_rows(local).to_columns(properties)
+
+    def to_pandas(self, properties: list = None, local: bool = False):
+        """
+        Same as `to_columns` but returns pandas DataFrame indexed by row ID.
+        """
+        return self._get_all_rows(local).to_pandas(properties)
+
+    def to_arrow(self, properties: list = None, local: bool = False):
+        """
+        Same as `to_columns` but returns pyarrow Table.
+        """
+        return self._get_all_rows(local).to_arrow(properties)
+
     @property
     def templates(self) -> Templates:
         if not self._templates:
@@ -186,6 +667,60 @@ class CollectionBlock(Block):
         return self._client.get_block(self.get("parent_id"))
 
 
+class CollectionRowReader:
+    """
+    Converter of raw row properties into Python values,
+    compiled once for a specific version of the collection schema.
+    """
+
+    def __init__(self, properties: list):
+        """
+        Create CollectionRowReader object.
+
+
+        Arguments
+        ---------
+        properties : list
+            Schema properties, as returned by `get_schema_properties`.
+        """
+        self._fields = []
+
+        for prop in properties:
+            if prop["type"] in ["formula", "rollup"]:
+                continue
+
+            converter = NotionToPythonConverter._get_converter_for_type(prop["type"])
+            if not converter:
+                raise ValueError(
+                    f"Prop '{prop['slug']}' with type '{prop['type']}'"
+                    " does not have a converter method"
+                )
+
+            self._fields.append((prop["id"], prop["slug"], converter, prop))
+
+    def read(self, row: "CollectionRowBlock") -> dict:
+        """
+        Convert all properties of the row into a dict keyed by slug.
+
+
+        Arguments
+        ---------
+        row : CollectionRowBlock
+            Row to read the properties from.
+
+
+        Returns
+        -------
+        dict
+            Converted properties.
+        """
+        raw = row.get("properties") or {}
+        return {
+            slug: converter(name=slug, value=raw.get(prop_id), prop=prop, block=row)
+            for prop_id, slug, converter, prop in self._fields
+        }
+
+
 class CollectionRowBlock(PageBlock):
     """
     Collection Row Block.
@@ -244,7 +779,7 @@ class CollectionRowBlock(PageBlock):
             operation, path, values = d
             path = path.split(".") if isinstance(path, str) else path
             if path and path[0] == "properties":
-                if len(path):
+                if len(path) > 1:
                     changed_props.add(path[1])
                 else:
                     for item in values:
@@ -266,6 +801,13 @@ class CollectionRowBlock(PageBlock):
             remaining, old_val, new_val
         )
 
+    def _get_callback_path(self, path: str) -> list:
+        prop = self.collection.get_schema_property(path)
+        if prop is not None:
+            return ["properties", prop["id"]]
+
+        return super()._get_callback_path(path)
+
     def _convert_mentioned_pages_to_python(self, value, prop):
         if not prop["type"] in ["title", "text"]:
             raise TypeError(
@@ -296,12 +838,7 @@ class CollectionRowBlock(PageBlock):
         return self._convert_notion_to_python(*self._get_property(name))
 
     def get_all_properties(self):
-        props = {}
-        for prop in self.schema:
-            prop_id = slugify(prop["name"])
-            props[prop_id] = self.get_property(prop_id)
-
-        return props
+        return self.collection._get_row_reader().read(self)
 
     def set_property(self, name, value):
         _, prop = self._get_property(name)
@@ -0,0 +1,422 @@
+from typing import NamedTuple, Any
+
+from notion.converter import NotionToPythonConverter
+
+
+class CategoricalColumn(NamedTuple):
+    """
+    Column of a select property stored as integer codes
+    pointing into the list of categories, -1 marks an empty value.
+    """
+
+    codes: Any
+    categories: list
+
+
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("Columnar export requires numpy: pip install numpy")
+
+    return numpy
+
+
+def _get_number(value):
+    if not value:
+        return float("nan")
+
+    return float(value[0][0].replace(",", ""))
+
+
+def _get_checkbox(value) -> bool:
+    return bool(value) and value[0][0] == "Yes"
+
+
+def _get_datetime(value) -> str:
+    try:
+        data = value[0][1][0][1]
+    except (IndexError, TypeError):
+        return "NaT"
+
+    start_date = data.get("start_date")
+    start_time = data.get("start_time")
+    if not start_date:
+        return "NaT"
+
+    return f"{start_date}T{start_time}" if start_time else start_date
+
+
+def _get_select(value):
+    return value[0][0] if value else None
+
+
+def _get_categorical_column(values: list, prop: dict) -> CategoricalColumn:
+    np = _import_numpy()
+    categories = [o["value"] for o in prop.get("options", [])]
+    lookup = {c: i for i, c in enumerate(categories)}
+    codes = np.empty(len(values), dtype="int32")
+
+    for i, value in enumerate(map(_get_select, values)):
+        if value is None:
+            codes[i] = -1
+            continue
+
+        if value not in lookup:
+            lookup[value] = len(categories)
+            categories.append(value)
+
+        codes[i] = lookup[value]
+
+    return CategoricalColumn(codes, categories)
+
+
+def get_columns(collection, row_ids: list, properties: list = None) -> dict:
+    """
+    Convert cached rows of the collection into a dict of columns,
+    in one pass per property over the raw record store values.
+
+    Numbers become float arrays (NaN when empty), checkboxes
+    become bool arrays, dates become datetime64 arrays of their start
+    (NaT when empty) and selects become CategoricalColumn.
+    Everything else is converted with NotionToPythonConverter
+    into an array of Python objects.
+
+
+    Arguments
+    ---------
+    collection : CollectionBlock
+        Collection to which the rows belong.
+
+    row_ids : list
+        IDs of the rows to export, in order.
+
+    properties : list, optional
+        IDs, slugs or names of properties to export.
+        Defaults to all properties except formulas and rollups.
+
+
+    Returns
+    -------
+    dict
+        Columns keyed by property slug.
+    """
+    from notion.block.collection.basic import CollectionRowBlock
+
+    np = _import_numpy()
+    store = collection._client._store
+
+    if properties is None:
+        props = collection.get_schema_properties()
+        props = [p for p in props if p["type"] not in ("formula", "rollup")]
+    else:
+        props = [collection.get_schema_property(p) for p in properties]
+        missing = [p for p, prop in zip(properties, props) if prop is None]
+        if missing:
+            raise ValueError(f"Unknown properties: {missing}")
+
+    records = [store._get("block", row_id) or {} for row_id in row_ids]
+    rows = {}
+    columns = {}
+
+    def get_row(row_id):
+        if row_id not in rows:
+            rows[row_id] = CollectionRowBlock(collection._client, row_id)
+        return rows[row_id]
+
+    for prop in props:
+        values = [r.get("properties", {}).get(prop["id"]) for r in records]
+        prop_type = prop["type"]
+
+        if prop_type == "number":
+            column = np.array([_get_number(v) for v in values], dtype="float64")
+        elif prop_type == "checkbox":
+            column = np.array([_get_checkbox(v) for v in values], dtype="bool")
+        elif prop_type == "date":
+            column = np.array([_get_datetime(v) for v in values], dtype="M8[s]")
+        elif prop_type == "select":
+            column = _get_categorical_column(values, prop)
+        else:
+            column = np.full(len(values), None, dtype="object")
+            for i, (row_id, value) in enumerate(zip(row_ids, values)):
+                # notion leaves empty properties out of the record
+                if value is None:
+                    continue
+                _, column[i] = NotionToPythonConverter.convert(
+                    name=prop["slug"], value=value, prop=prop, block=get_row(row_id)
+                )
+
+        columns[prop["slug"]] = column
+
+    return columns
+
+
+def columns_to_pandas(columns: dict, index: list = None):
+    """
+    Convert columns returned by `get_columns` into a pandas DataFrame.
+    """
+    try:
+        import pandas as pd
+    except ImportError:
+        raise ImportError("Pandas export requires pandas: pip install pandas")
+
+    data = {}
+    for name, column in columns.items():
+        if isinstance(column, CategoricalColumn):
+            column = pd.Categorical.from_codes(column.codes, column.categories)
+        data[name] = column
+
+    return pd.DataFrame(data, index=index)
+
+
+def _to_arrow_value(value):
+    if isinstance(value, list):
+        return [_to_arrow_value(v) for v in value]
+
+    if hasattr(value, "id"):
+        return value.id
+
+    if hasattr(value, "start"):
+        return value.start
+
+    return value
+
+
+def columns_to_arrow(columns: dict):
+    """
+    Convert columns returned by `get_columns` into a pyarrow Table.
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError("Arrow export requires pyarrow: pip install pyarrow")
+
+    data = {}
+    for name, column in columns.items():
+        if isinstance(column, CategoricalColumn):
+            codes = pa.array(column.codes, mask=column.codes < 0)
+            column = pa.DictionaryArray.from_arrays(codes, column.categories)
+        elif column.dtype == "object":
+            column = pa.array([_to_arrow_value(v) for v in column])
+        data[name] = column
+
+    return pa.table(data)
+
+
+def _get_person_ids(value) -> list:
+    return [i[1][0][1] for i in value or [] if i[0] == "‣"]
+
+
+def _get_multi_select(value) -> list:
+    return [v.strip() for v in value[0][0].split(",")] if value else []
+
+
+def _bucket_dates(column, bucket: str):
+    days = column.astype("M8[D]")
+
+    if bucket == "day":
+        return days
+    if bucket == "week":
+        # 1970-01-01 was a Thursday, shift everything back to Mondays
+        offsets = (days.astype("int64") + 3) % 7
+        return days - offsets.astype("m8[D]")
+    if bucket == "month":
+        return days.astype("M8[M]").astype("M8[D]")
+    if bucket == "year":
+        return days.astype("M8[Y]").astype("M8[D]")
+
+    raise ValueError(f"Unsupported date bucket: '{bucket}'")
+
+
+def _get_group_keys(records: list, prop: dict, bucket: str) -> list:
+    """
+    Get list of group keys for each row, rows with many values
+    (like multi selects or persons) fall into many groups.
+    """
+    np = _import_numpy()
+    values = [r.get("properties", {}).get(prop["id"]) for r in records]
+    prop_type = prop["type"]
+
+    if prop_type == "select":
+        return [[_get_select(v)] for v in values]
+    if prop_type == "multi_select":
+        return [_get_multi_select(v) or [None] for v in values]
+    if prop_type == "person":
+        return [_get_person_ids(v) or [None] for v in values]
+    if prop_type == "checkbox":
+        return [[_get_checkbox(v)] for v in values]
+    if prop_type == "date":
+        column = np.array([_get_datetime(v) for v in values], dtype="M8[s]")
+        return [[k] for k in _bucket_dates(column, bucket).astype(object)]
+
+    raise ValueError(f"Can't group by prop '{prop['slug']}' with type '{prop_type}'")
+
+
+def _count_distinct(column) -> int:
+    if isinstance(column, CategoricalColumn):
+        return len(set(column.codes[column.codes >= 0].tolist()))
+
+    if column.dtype == "float64":
+        return len(set(column[~_import_numpy().isnan(column)].tolist()))
+
+    return len(set(map(repr, column[_get_filled_mask(column)])))
+
+
+def _get_filled_mask(column):
+    np = _import_numpy()
+
+    if isinstance(column, CategoricalColumn):
+        return column.codes >= 0
+    if column.dtype == "float64":
+        return ~np.isnan(column)
+    if column.dtype.kind == "M":
+        return ~np.isnat(column)
+    if column.dtype == "bool":
+        return np.ones(len(column), dtype="bool")
+
+    return np.array([v not in (None, "", []) for v in column], dtype="bool")
+
+
+def _take(column, idx):
+    if isinstance(column, CategoricalColumn):
+        return CategoricalColumn(column.codes[idx], column.categories)
+
+    return column[idx]
+
+
+def _get_numbers(column):
+    np = _import_numpy()
+
+    if isinstance(column, CategoricalColumn) or column.dtype.kind not in "fbi":
+        raise ValueError("This aggregator works only on numbers and checkboxes")
+
+    column = column.astype("float64")
+    return column[~np.isnan(column)]
+
+
+def _reduce(fn, default=None):
+    def reduce(column, **_):
+        numbers = _get_numbers(column)
+        return fn(numbers).item() if len(numbers) else default
+
+    return reduce
+
+
+def _percentile(column, percentile=50, **_):
+    numbers = _get_numbers(column)
+    if not len(numbers):
+        return None
+
+    return _import_numpy().percentile(numbers, percentile).item()
+
+
+_column_aggregators = {
+    "count": lambda c, **_: len(c.codes if isinstance(c, CategoricalColumn) else c),
+    "count_values": lambda c, **_: int(_get_filled_mask(c).sum()),
+    "not_empty": lambda c, **_: int(_get_filled_mask(c).sum()),
+    "empty": lambda c, **_: int((~_get_filled_mask(c)).sum()),
+    "unique": lambda c, **_: _count_distinct(c),
+    "sum": _reduce(lambda n: n.sum(), default=0),
+    "average": _reduce(lambda n: n.mean()),
+    "median": _reduce(lambda n: _import_numpy().median(n)),
+    "min": _reduce(lambda n: n.min()),
+    "max": _reduce(lambda n: n.max()),
+    "range": _reduce(lambda n: n.max() - n.min()),
+    "std": _reduce(lambda n: n.std()),
+    "percentile": _percentile,
+}
+
+
+def aggregate_columns(
+    collection,
+    row_ids: list,
+    aggregations: list,
+    group_by: str = None,
+    date_bucket: str = "day",
+) -> dict:
+    """
+    Compute aggregations over cached rows of the collection,
+    optionally grouped by values of another property.
+
+
+    Arguments
+    ---------
+    collection : CollectionBlock
+        Collection to which the rows belong.
+
+    row_ids : list
+        IDs of the rows to aggregate.
+
+    aggregations : list
+        List of dicts with "id", "property" and "aggregator" keys,
+        the same format as in query aggregations. Supported aggregators
+        are count, count_values, not_empty, empty, unique, sum, average,
+        median, min, max, range, std and percentile (which also takes
+        a "percentile" key, between 0 and 100).
+
+    group_by : str, optional
+        ID, slug or name of a select, multi select, person,
+        checkbox or date property to group the rows by.
+        Defaults to None.
+
+    date_bucket : str, optional
+        How to bucket the dates when grouping by a date property,
+        one of "day", "week", "month" or "year".
+        Defaults to "day".
+
+
+    Returns
+    -------
+    dict
+        Results keyed by aggregation ID, or if `group_by` was passed,
+        dicts of such results keyed by the group value.
+    """
+    np = _import_numpy()
+
+    for data in aggregations:
+        if data.get("aggregator") not in _column_aggregators:
+            raise ValueError(f"Unsupported aggregator: '{data.get('aggregator')}'")
+
+    properties = {data["property"] for data in aggregations if data.get("property")}
+    columns = get_columns(collection, row_ids, list(properties))
+    columns = {
+        p: columns[collection.get_schema_property(p)["slug"]] for p in properties
+    }
+
+    # aggregations without a property (like count) only need the row count
+    no_column = np.zeros(len(row_ids))
+
+    def compute(idx):
+        results = {}
+        for data in aggregations:
+            column = columns.get(data.get("property"), no_column)
+            fn = _column_aggregators[data["aggregator"]]
+            results[data["id"]] = fn(_take(column, idx), **data)
+        return results
+
+    if not group_by:
+        return compute(np.arange(len(row_ids)))
+
+    prop = collection.get_schema_property(group_by)
+    if prop is None:
+        raise ValueError(f"Unknown property: '{group_by}'")
+
+    store = collection._client._store
+    records = [store._get("block", row_id) or {} for row_id in row_ids]
+
+    # explode the rows into (row index, group code) pairs
+    groups = {}
+    rows, codes = [], []
+    for i, keys in enumerate(_get_group_keys(records, prop, date_bucket)):
+        for key in keys:
+            rows.append(i)
+            codes.append(groups.setdefault(key, len(groups)))
+
+    rows, codes = np.array(rows, dtype="int64"), np.array(codes, dtype="int64")
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(groups) + 1))
+
+    return {
+        key: compute(rows[order[bounds[code] : bounds[code + 1]]])
+        for key, code in groups.items()
+    }
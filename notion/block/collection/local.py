@@ -0,0 +1,389 @@
+from datetime import date, datetime, timedelta
+from statistics import median
+
+from notion.block.collection.common import NotionDate
+from notion.converter import NotionToPythonConverter
+from notion.utils import to_list
+
+
+def _is_empty(value) -> bool:
+    if isinstance(value, NotionDate):
+        return value.start is None
+
+    return value is None or value == "" or value == []
+
+
+def _to_date(value):
+    if isinstance(value, NotionDate):
+        value = value.start
+
+    if isinstance(value, datetime):
+        return value.date()
+
+    return value
+
+
+def _to_ids(value) -> set:
+    return {getattr(v, "id", v) for v in to_list(value or [])}
+
+
+def _to_texts(value) -> list:
+    return [str(v).lower() for v in to_list(value)]
+
+
+def _get_relative_date(value: str) -> date:
+    today = date.today()
+    deltas = {
+        "today": 0,
+        "tomorrow": 1,
+        "yesterday": -1,
+        "one_week_ago": -7,
+        "one_week_from_now": 7,
+        "one_month_ago": -30,
+        "one_month_from_now": 30,
+    }
+
+    if value not in deltas:
+        raise ValueError(f"Unsupported relative date: '{value}'")
+
+    return today + timedelta(days=deltas[value])
+
+
+def _get_filter_value(data: dict):
+    """
+    Extract the value to compare against from the filter, handling both
+    the new format ({"filter": {"operator", "value": {"type", "value"}}})
+    and the old one ({"comparator", "value"}).
+    """
+    if "filter" not in data:
+        return data.get("value")
+
+    value = data["filter"].get("value")
+    if not isinstance(value, dict) or "type" not in value:
+        return value
+
+    if value["type"] == "relative":
+        return _get_relative_date(value["value"])
+
+    value = value.get("value")
+    if isinstance(value, dict):
+        if value.get("type", "").startswith("date"):
+            return _to_date(NotionDate.from_notion(value))
+
+        if "id" in value:
+            return value["id"]
+
+    return value
+
+
+def _compare_numbers(op):
+    def compare(value, target):
+        if value is None or target in (None, ""):
+            return False
+        return op(float(value), float(target))
+
+    return compare
+
+
+def _compare_dates(op):
+    def compare(value, target):
+        value = _to_date(value)
+        if value is None or target is None:
+            return False
+        return op(value, _to_date(target))
+
+    return compare
+
+
+def _to_bool(value) -> bool:
+    if isinstance(value, str):
+        return value.lower() in ("yes", "true", "checked")
+
+    return bool(value)
+
+
+def _contains_text(value, target):
+    return any(str(target).lower() in v for v in _to_texts(value))
+
+
+_operators = {
+    "is_empty": lambda v, _: _is_empty(v),
+    "is_not_empty": lambda v, _: not _is_empty(v),
+    "string_is": lambda v, t: str(v or "").lower() == str(t).lower(),
+    "string_is_not": lambda v, t: str(v or "").lower() != str(t).lower(),
+    "string_contains": lambda v, t: str(t).lower() in str(v or "").lower(),
+    "string_does_not_contain": lambda v, t: str(t).lower() not in str(v or "").lower(),
+    "string_starts_with": lambda v, t: str(v or "").lower().startswith(str(t).lower()),
+    "string_ends_with": lambda v, t: str(v or "").lower().endswith(str(t).lower()),
+    "number_equals": _compare_numbers(lambda a, b: a == b),
+    "number_does_not_equal": _compare_numbers(lambda a, b: a != b),
+    "number_greater_than": _compare_numbers(lambda a, b: a > b),
+    "number_less_than": _compare_numbers(lambda a, b: a < b),
+    "number_greater_than_or_equal_to": _compare_numbers(lambda a, b: a >= b),
+    "number_less_than_or_equal_to": _compare_numbers(lambda a, b: a <= b),
+    "enum_is": lambda v, t: v == t,
+    "enum_is_not": lambda v, t: v != t,
+    "enum_contains": lambda v, t: t in to_list(v or []),
+    "enum_does_not_contain": lambda v, t: t not in to_list(v or []),
+    "checkbox_is": lambda v, t: _to_bool(v) == _to_bool(t),
+    "checkbox_is_not": lambda v, t: _to_bool(v) != _to_bool(t),
+    "date_is": _compare_dates(lambda a, b: a == b),
+    "date_is_before": _compare_dates(lambda a, b: a < b),
+    "date_is_after": _compare_dates(lambda a, b: a > b),
+    "date_is_on_or_before": _compare_dates(lambda a, b: a <= b),
+    "date_is_on_or_after": _compare_dates(lambda a, b: a >= b),
+    "person_contains": lambda v, t: t in _to_ids(v),
+    "person_does_not_contain": lambda v, t: t not in _to_ids(v),
+    "relation_contains": lambda v, t: t in _to_ids(v),
+    "relation_does_not_contain": lambda v, t: t not in _to_ids(v),
+    "file_contains": _contains_text,
+}
+
+
+def _get_sort_key(value):
+    """
+    Build a key for sorting which puts empty values last
+    and compares values of different types in a stable way.
+    """
+    if _is_empty(value):
+        return 1, ""
+
+    if isinstance(value, NotionDate):
+        value = value.start
+
+    if isinstance(value, bool):
+        return 0, int(value)
+
+    if isinstance(value, (int, float)):
+        return 0, value
+
+    if isinstance(value, datetime):
+        return 0, value.timestamp()
+
+    if isinstance(value, date):
+        return 0, datetime(value.year, value.month, value.day).timestamp()
+
+    if isinstance(value, list):
+        return 0, ",".join(str(getattr(v, "id", v)) for v in value).lower()
+
+    return 0, str(getattr(value, "id", value)).lower()
+
+
+def _get_numbers(values: list) -> list:
+    numbers = []
+
+    for value in values:
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, (int, float)):
+            numbers.append(value)
+
+    return numbers
+
+
+def _get_dates(values: list) -> list:
+    dates = [_to_date(v) for v in values if isinstance(v, NotionDate)]
+    return [d for d in dates if d is not None]
+
+
+def _count_unique(values: list) -> int:
+    unique = set()
+
+    for value in values:
+        for item in to_list(value):
+            if not _is_empty(item):
+                unique.add(_get_sort_key(item))
+
+    return len(unique)
+
+
+def _percent(part: int, total: int) -> float:
+    return part / total * 100 if total else 0
+
+
+_aggregators = {
+    "count": lambda v: len(v),
+    "count_values": lambda v: sum(len(to_list(i)) for i in v if not _is_empty(i)),
+    "unique": _count_unique,
+    "empty": lambda v: sum(_is_empty(i) for i in v),
+    "not_empty": lambda v: sum(not _is_empty(i) for i in v),
+    "percent_empty": lambda v: _percent(sum(_is_empty(i) for i in v), len(v)),
+    "percent_not_empty": lambda v: _percent(sum(not _is_empty(i) for i in v), len(v)),
+    "sum": lambda v: sum(_get_numbers(v)),
+    "average": lambda v: (
+        sum(_get_numbers(v)) / len(_get_numbers(v)) if _get_numbers(v) else None
+    ),
+    "median": lambda v: median(_get_numbers(v)) if _get_numbers(v) else None,
+    "min": lambda v: min(_get_numbers(v), default=None),
+    "max": lambda v: max(_get_numbers(v), default=None),
+    "range": lambda v: (
+        max(_get_numbers(v)) - min(_get_numbers(v)) if _get_numbers(v) else None
+    ),
+    "earliest_date": lambda v: min(_get_dates(v), default=None),
+    "latest_date": lambda v: max(_get_dates(v), default=None),
+    "date_range": lambda v: (
+        max(_get_dates(v)) - min(_get_dates(v)) if _get_dates(v) else None
+    ),
+}
+
+
+class LocalQuery:
+    """
+    Evaluate a CollectionQuery against rows cached in the local record store,
+    without sending any requests to the server.
+    """
+
+    def __init__(self, query):
+        """
+        Create LocalQuery object.
+
+
+        Arguments
+        ---------
+        query : CollectionQuery
+            Already normalized query to evaluate.
+        """
+        self.query = query
+        self.collection = query.collection
+        self._client = query.collection._client
+        self._store = self._client._store
+        self._values = {}
+        self._rows = {}
+
+    def _get_row(self, row_id: str):
+        from notion.block.collection.basic import CollectionRowBlock
+
+        if row_id not in self._rows:
+            self._rows[row_id] = CollectionRowBlock(self._client, row_id)
+
+        return self._rows[row_id]
+
+    def _forget_row(self, row_id: str):
+        self._values.pop(row_id, None)
+
+    def _get_value(self, row_id: str, prop_id: str):
+        values = self._values.setdefault(row_id, {})
+        if prop_id not in values:
+            prop = self.collection.get_schema_property(prop_id)
+            if prop is None:
+                raise ValueError(f"Unknown property: '{prop_id}'")
+
+            if not NotionToPythonConverter._get_converter_for_type(prop["type"]):
+                raise ValueError(
+                    f"Prop '{prop['slug']}' with type '{prop['type']}'"
+                    " can't be evaluated locally"
+                )
+
+            raw = self._store._get("block", row_id).get("properties", {})
+            value = raw.get(prop_id)
+
+            # notion leaves empty properties out of the record
+            if value is None and prop["type"] in ("title", "text"):
+                values[prop_id] = ""
+            else:
+                values[prop_id] = self._get_row(row_id)._convert_notion_to_python(
+                    value, prop
+                )
+
+        return values[prop_id]
+
+    def _get_row_ids(self) -> list:
+        row_ids = self._store.get_cached_collection_rows(self.collection.id)
+
+        # keep the order of the view, just like the server does
+        page_sort = self.query.collection_view.get("page_sort", [])
+        order = {row_id: i for i, row_id in enumerate(page_sort)}
+        return sorted(row_ids, key=lambda i: order.get(i, len(order)))
+
+    def _matches_search(self, row_id: str) -> bool:
+        search = self.query.search.lower()
+        if not search:
+            return True
+
+        for prop in self.collection.get_schema_properties():
+            if prop["type"] in ("title", "text"):
+                if search in str(self._get_value(row_id, prop["id"])).lower():
+                    return True
+
+        return False
+
+    def _matches(self, row_id: str, data: dict) -> bool:
+        if not data:
+            return True
+
+        if "filters" in data:
+            operator = data.get("operator") or data.get("filter_operator", "and")
+            results = (self._matches(row_id, f) for f in to_list(data["filters"]))
+            return any(results) if operator == "or" else all(results)
+
+        filter = data.get("filter", {})
+        operator = filter.get("operator") or data.get("comparator")
+        if operator not in _operators:
+            raise ValueError(f"Unsupported filter operator: '{operator}'")
+
+        value = self._get_value(row_id, data["property"])
+        return _operators[operator](value, _get_filter_value(data))
+
+    def _matches_query(self, row_id: str) -> bool:
+        filter = {"filters": to_list(self.query.filter or []), "operator": "and"}
+        return self._matches_search(row_id) and self._matches(row_id, filter)
+
+    def _sort(self, row_ids: list) -> list:
+        # sort by the least significant key first, python's sort is stable
+        for data in reversed(to_list(self.query.sort or [])):
+            keys = {
+                i: _get_sort_key(self._get_value(i, data["property"])) for i in row_ids
+            }
+            filled = [i for i in row_ids if not keys[i][0]]
+            empty = [i for i in row_ids if keys[i][0]]
+
+            # empty values always go last, no matter the direction
+            descending = data.get("direction") == "descending"
+            row_ids = sorted(filled, key=lambda i: keys[i][1], reverse=descending)
+            row_ids += empty
+
+        return row_ids
+
+    def _aggregate(self, row_ids: list) -> list:
+        results = []
+
+        for data in self.query.aggregate or self.query.aggregations:
+            aggregator = data.get("aggregator") or data.get("aggregation_type")
+            if aggregator not in _aggregators:
+                raise ValueError(f"Unsupported aggregator: '{aggregator}'")
+
+            prop_id = data.get("property")
+            if aggregator == "count" or not prop_id:
+                values = [None] * len(row_ids)
+            else:
+                values = [self._get_value(i, prop_id) for i in row_ids]
+
+            results.append(
+                {"type": "number", "value": _aggregators[aggregator](values)}
+            )
+
+        return results
+
+    def execute(self) -> dict:
+        """
+        Execute the query.
+
+
+        Returns
+        -------
+        dict
+            Result of the query in the same format
+            as the one returned by the server.
+        """
+        if self.query.type == "calendar":
+            raise ValueError("Calendar queries can't be evaluated locally")
+
+        row_ids = [i for i in self._get_row_ids() if self._matches_query(i)]
+        row_ids = self._sort(row_ids)
+
+        return {
+            "type": self.query.type,
+            "blockIds": row_ids,
+            "aggregationResults": self._aggregate(row_ids),
+            "total": len(row_ids),
+        }
@@ -0,0 +1,261 @@
+from bisect import bisect_left
+from collections import defaultdict
+from threading import RLock
+from typing import Callable
+
+from notion.block.collection.common import NotionDate
+from notion.block.collection.local import LocalQuery, _get_sort_key
+from notion.utils import to_list
+
+
+class _SortKey:
+    """
+    Comparable key of a row built from the query sorts,
+    empty values go last no matter the direction.
+    """
+
+    __slots__ = ("keys", "directions", "position")
+
+    def __init__(self, keys: list, directions: list, position: int):
+        self.keys = keys
+        self.directions = directions
+        self.position = position
+
+    def __eq__(self, other: "_SortKey") -> bool:
+        return self.keys == other.keys and self.position == other.position
+
+    def __lt__(self, other: "_SortKey") -> bool:
+        for (empty, value), (o_empty, o_value), descending in zip(
+            self.keys, other.keys, self.directions
+        ):
+            if empty != o_empty:
+                return empty < o_empty
+            if value != o_value:
+                return value > o_value if descending else value < o_value
+
+        # fall back to the order of the view, just like the server does
+        return self.position < other.position
+
+
+def _get_group_keys(value) -> list:
+    if isinstance(value, NotionDate):
+        value = value.start
+
+    if isinstance(value, list):
+        return [getattr(v, "id", v) for v in value] or [None]
+
+    return [getattr(value, "id", value)]
+
+
+class MaterializedView:
+    """
+    Result of a CollectionQuery kept up to date incrementally,
+    from the changes of single rows seen by the local record store.
+    """
+
+    def __init__(self, query, group_by: str = None, callback: Callable = None):
+        """
+        Create MaterializedView object.
+
+
+        Arguments
+        ---------
+        query : CollectionQuery
+            Query with the filter, sort, search and aggregations to maintain.
+
+        group_by : str, optional
+            ID, slug or name of a property to group the rows by.
+            Rows with many values (like multi selects) fall into many groups.
+            Defaults to None.
+
+        callback : Callable, optional
+            Called with the view after each change of its rows.
+            Defaults to None.
+        """
+        if query.type == "calendar":
+            raise ValueError("Calendar queries can't be materialized")
+
+        self.query = query
+        self.collection = query.collection
+        self.callback = callback
+        self._store = self.collection._client._store
+        self._local = LocalQuery(query)
+        self._lock = RLock()
+        self._sort = to_list(query.sort or [])
+        self._directions = [s.get("direction") == "descending" for s in self._sort]
+
+        self._group_prop = None
+        if group_by:
+            self._group_prop = self.collection.get_schema_property(group_by)
+            if self._group_prop is None:
+                raise ValueError(f"Unknown property: '{group_by}'")
+
+        self.rebuild()
+        self._store.add_materialized_view(self)
+
+    def __len__(self) -> int:
+        return len(self._row_ids)
+
+    def __iter__(self):
+        return iter([self._local._get_row(i) for i in self.row_ids])
+
+    def __contains__(self, row_id: str) -> bool:
+        return row_id in self._sort_keys
+
+    def _get_sort_key(self, row_id: str) -> _SortKey:
+        keys = [
+            _get_sort_key(self._local._get_value(row_id, s["property"]))
+            for s in self._sort
+        ]
+        position = self._positions.setdefault(row_id, len(self._positions))
+        return _SortKey(keys, self._directions, position)
+
+    @staticmethod
+    def _insert_sorted(keys: list, row_ids: list, key: _SortKey, row_id: str):
+        index = bisect_left(keys, key)
+        keys.insert(index, key)
+        row_ids.insert(index, row_id)
+
+    @staticmethod
+    def _remove_sorted(keys: list, row_ids: list, key: _SortKey):
+        index = bisect_left(keys, key)
+        del keys[index]
+        del row_ids[index]
+
+    def _insert(self, row_id: str):
+        key = self._get_sort_key(row_id)
+        self._insert_sorted(self._keys, self._row_ids, key, row_id)
+        self._sort_keys[row_id] = key
+
+        if self._group_prop:
+            value = self._local._get_value(row_id, self._group_prop["id"])
+            self._row_groups[row_id] = _get_group_keys(value)
+
+        # every group keeps its rows in order too
+        for group in self._row_groups.get(row_id, [None]):
+            keys, row_ids = self._groups[group]
+            self._insert_sorted(keys, row_ids, key, row_id)
+            self._aggregates.pop(group, None)
+
+    def _remove(self, row_id: str):
+        key = self._sort_keys.pop(row_id, None)
+        if key is None:
+            return
+
+        self._remove_sorted(self._keys, self._row_ids, key)
+
+        for group in self._row_groups.pop(row_id, [None]):
+            keys, row_ids = self._groups[group]
+            self._remove_sorted(keys, row_ids, key)
+            self._aggregates.pop(group, None)
+            if not row_ids:
+                del self._groups[group]
+
+    def _is_row(self, row_id: str) -> bool:
+        value = self._store._get("block", row_id)
+        return (
+            bool(value)
+            and value.get("alive", True)
+            and not value.get("is_template")
+            and value.get("parent_table") == "collection"
+            and value.get("parent_id") == self.collection.id
+        )
+
+    def rebuild(self):
+        """
+        Evaluate the query again against all rows in the local record store.
+        """
+        with self._lock:
+            self._local._values.clear()
+            self._row_ids = []
+            self._keys = []
+            self._sort_keys = {}
+            self._row_groups = {}
+            self._groups = defaultdict(lambda: ([], []))
+            self._aggregates = {}
+
+            row_ids = self._local._get_row_ids()
+            self._positions = {row_id: i for i, row_id in enumerate(row_ids)}
+            for row_id in row_ids:
+                if self._local._matches_query(row_id):
+                    self._insert(row_id)
+
+    def update_row(self, row_id: str):
+        """
+        Reevaluate the row after it has changed in the local record store,
+        in time proportional to the logarithm of the number of rows.
+        """
+        with self._lock:
+            self._remove(row_id)
+            self._local._forget_row(row_id)
+            if self._is_row(row_id) and self._local._matches_query(row_id):
+                self._insert(row_id)
+
+        if self.callback:
+            self.callback(self)
+
+    def remove_row(self, row_id: str):
+        """
+        Drop the row which is no longer a part of the collection.
+        """
+        with self._lock:
+            self._remove(row_id)
+            self._local._forget_row(row_id)
+
+        if self.callback:
+            self.callback(self)
+
+    def close(self):
+        """
+        Stop updating the view.
+        """
+        self._store.remove_materialized_view(self)
+
+    @property
+    def row_ids(self) -> list:
+        """
+        IDs of the matching rows, in order.
+        """
+        with self._lock:
+            return list(self._row_ids)
+
+    @property
+    def groups(self) -> dict:
+        """
+        IDs of the matching rows, in order, keyed by the group value.
+        """
+        with self._lock:
+            return {group: list(ids) for group, (_, ids) in self._groups.items()}
+
+    def get_aggregates(self, group=None) -> dict:
+        """
+        Get results of the query aggregations.
+
+        Only the groups touched by changes since
+        the previous call are computed again.
+
+
+        Arguments
+        ---------
+        group : Any, optional
+            Value of the group to aggregate, when grouped.
+            Defaults to None, meaning all rows when not grouped.
+
+
+        Returns
+        -------
+        dict
+            Aggregation results keyed by the aggregation ID.
+        """
+        aggregations = self.query.aggregate or self.query.aggregations
+
+        with self._lock:
+            if group not in self._aggregates:
+                row_ids = list(self._groups.get(group, ((), ()))[1])
+                results = self._local._aggregate(row_ids)
+                self._aggregates[group] = {
+                    data.get("id"): result["value"]
+                    for data, result in zip(aggregations, results)
+                }
+
+            return dict(self._aggregates[group])
@@ -1,7 +1,16 @@
+import json
 from typing import Union
 
 from notion.block.basic import Block
+from notion.block.collection.columnar import (
+    aggregate_columns,
+    get_columns,
+    columns_to_pandas,
+    columns_to_arrow,
+)
 from notion.block.collection.common import _normalize_query_data, _normalize_prop_name
+from notion.block.collection.local import LocalQuery
+from notion.settings import QUERY_PAGE_SIZE
 from notion.utils import extract_id
 from notion.block.types import get_collection_query_result_type
 
@@ -42,35 +51,161 @@ class CollectionQuery:
         self.group_by = _normalize_prop_name(group_by, collection)
         self._client = collection._client
 
-    def execute(self) -> "CollectionQueryResult":
+    def _get_query_kwargs(self) -> dict:
+        return {
+            "collection_id": self.collection.id,
+            "collection_view_id": self.collection_view.id,
+            "search": self.search,
+            "type": self.type,
+            "aggregate": self.aggregate,
+            "aggregations": self.aggregations,
+            "filter": self.filter,
+            "sort": self.sort,
+            "calendar_by": self.calendar_by,
+            "group_by": self.group_by,
+        }
+
+    def execute(
+        self, page_size: int = None, local: bool = False
+    ) -> "CollectionQueryResult":
         """
         Execute the query.
 
 
+        Arguments
+        ---------
+        page_size : int, optional
+            If set, fetch the rows page by page with `page_size`
+            rows per request, until all of them are loaded.
+            Otherwise load up to QUERY_LIMIT rows in one request.
+            Defaults to None.
+
+        local : bool, optional
+            Whether or not to evaluate the query against the rows
+            already cached in the local record store, instead of
+            asking the server. The `page_size` is ignored then.
+            Defaults to False.
+
+
         Returns
         -------
         CollectionQueryResult
             Result of the query.
         """
-
         klass = get_collection_query_result_type(self.type)
+        store = self._client._store
+        kwargs = self._get_query_kwargs()
 
-        return klass(
-            self.collection,
-            self._client._store.call_query_collection(
-                collection_id=self.collection.id,
-                collection_view_id=self.collection_view.id,
-                search=self.search,
-                type=self.type,
-                aggregate=self.aggregate,
-                aggregations=self.aggregations,
-                filter=self.filter,
-                sort=self.sort,
-                calendar_by=self.calendar_by,
-                group_by=self.group_by,
-            ),
-            self,
-        )
+        if local:
+            return klass(self.collection, LocalQuery(self).execute(), self)
+
+        if not page_size:
+            return klass(self.collection, store.call_query_collection(**kwargs), self)
+
+        block_ids = []
+        result = {}
+        for new_ids, result in store.iter_query_collection(page_size, **kwargs):
+            block_ids += new_ids
+
+        result = {**result, "blockIds": block_ids}
+        return klass(self.collection, result, self)
+
+    def prepare(self, cache: bool = False) -> "PreparedCollectionQuery":
+        """
+        Build the request payload once, for executing the same query many times.
+
+
+        Arguments
+        ---------
+        cache : bool, optional
+            Whether or not to keep the result in the query cache
+            of the local record store.
+            Defaults to False.
+
+
+        Returns
+        -------
+        PreparedCollectionQuery
+            Query ready for repeated execution.
+        """
+        return PreparedCollectionQuery(self, cache=cache)
+
+    def iter_rows(self, page_size: int = QUERY_PAGE_SIZE):
+        """
+        Execute the query lazily, fetching the rows page by page.
+
+
+        Arguments
+        ---------
+        page_size : int, optional
+            Number of rows to fetch per request.
+            Defaults to QUERY_PAGE_SIZE.
+
+
+        Returns
+        -------
+        Iterator[CollectionRowBlock]
+            Rows matching the query, available as soon as their page arrives.
+        """
+        store = self._client._store
+        kwargs = self._get_query_kwargs()
+
+        for new_ids, result in store.iter_query_collection(page_size, **kwargs):
+            result = {**result, "blockIds": new_ids}
+            yield from CollectionQueryResult(self.collection, result, self)
+
+
+class PreparedCollectionQuery:
+    """
+    Collection Query normalized and serialized only once.
+    """
+
+    def __init__(self, query: CollectionQuery, cache: bool = False):
+        """
+        Create PreparedCollectionQuery object.
+
+
+        Arguments
+        ---------
+        query : CollectionQuery
+            Query to prepare.
+
+        cache : bool, optional
+            Whether or not to keep the result in the query cache
+            of the local record store, see `RecordStore.call_query_collection`.
+            The collection version only moves when the store learns
+            about changes, so enable it together with the monitor.
+            Defaults to False.
+        """
+        self.query = query
+        self.cache = cache
+        self._store = query._client._store
+        self._result_type = get_collection_query_result_type(query.type)
+
+        data = self._store._build_query_collection_data(**query._get_query_kwargs())
+        self._payload = json.dumps(data, separators=(",", ":")).encode()
+
+    def execute(self) -> "CollectionQueryResult":
+        """
+        Execute the query, reusing the prepared payload.
+
+
+        Returns
+        -------
+        CollectionQueryResult
+            Result of the query.
+        """
+        collection = self.query.collection
+
+        if self.cache:
+            # the payload is already serialized, so it's the cache key as well
+            result = self._store._cached_query_collection(
+                self._payload, collection.id, self._payload
+            )
+        else:
+            result = self._store._post_query_collection(self._payload)
+
+        return self._result_type(collection, result, self.query)
 
 
 class CollectionQueryResult:
@@ -82,6 +217,7 @@ class CollectionQueryResult:
 
     def __init__(self, collection, result, query: CollectionQuery):
         self._block_ids = self._get_block_ids(result)
+        self._block_id_set = self._get_block_id_set()
         self.collection = collection
         self.query = query
         self.aggregates = result.get("aggregationResults", [])
@@ -100,20 +236,30 @@ class CollectionQueryResult:
         return len(self._block_ids)
 
     def __getitem__(self, key):
-        return list(iter(self))[key]
+        result = self._block_ids[key]
+        if isinstance(key, slice):
+            return [self._get_block(bid) for bid in result]
+
+        return self._get_block(result)
 
     def __iter__(self):
         return iter(self._get_block(bid) for bid in self._block_ids)
 
     def __reversed__(self):
-        return reversed(list(self))
+        return iter(self._get_block(bid) for bid in reversed(self._block_ids))
 
     def __contains__(self, other: Union[Block, str]) -> bool:
-        return extract_id(other) in self._block_ids
+        return extract_id(other) in self._block_id_set
 
     def _get_block_ids(self, result: dict) -> list:
         return result["blockIds"]
 
+    def _get_block_id_set(self) -> set:
+        return set(self._block_ids)
+
+    def _get_row_ids(self) -> list:
+        return self._block_ids
+
     def _get_block(self, block_id: str):
         from notion.block.collection.basic import CollectionRowBlock
 
@@ -128,6 +274,108 @@ class CollectionQueryResult:
                 return agg["value"]
         return None
 
+    def get_all_properties(self) -> list:
+        """
+        Read all properties of every row, with a single
+        row reader compiled for the collection schema.
+
+
+        Returns
+        -------
+        list of dict
+            Converted properties of each row, in order.
+        """
+        reader = self.collection._get_row_reader()
+        return [reader.read(self._get_block(i)) for i in self._get_row_ids()]
+
+    def aggregate(
+        self, aggregations: list, group_by: str = None, date_bucket: str = "day"
+    ) -> dict:
+        """
+        Compute aggregations over the rows locally, see `aggregate_columns`.
+
+
+        Arguments
+        ---------
+        aggregations : list
+            List of dicts with "id", "property" and "aggregator" keys.
+
+        group_by : str, optional
+            ID, slug or name of a property to group the rows by.
+            Defaults to None.
+
+        date_bucket : str, optional
+            One of "day", "week", "month" or "year",
+            used when grouping by a date property.
+            Defaults to "day".
+
+
+        Returns
+        -------
+        dict
+            Results keyed by aggregation ID, or by group value and then ID.
+        """
+        return aggregate_columns(
+            self.collection, self._get_row_ids(), aggregations, group_by, date_bucket
+        )
+
+    def to_columns(self, properties: list = None) -> dict:
+        """
+        Export the rows as typed columns, see `get_columns`.
+
+
+        Arguments
+        ---------
+        properties : list, optional
+            IDs, slugs or names of properties to export.
+            Defaults to all properties except formulas and rollups.
+
+
+        Returns
+        -------
+        dict
+            NumPy arrays or CategoricalColumns keyed by property slug.
+        """
+        return get_columns(self.collection, self._get_row_ids(), properties)
+
+    def to_pandas(self, properties: list = None):
+        """
+        Export the rows as pandas DataFrame indexed by row ID.
+
+
+        Arguments
+        ---------
+        properties : list, optional
+            IDs, slugs or names of properties to export.
+            Defaults to all properties except formulas and rollups.
+
+
+        Returns
+        -------
+        pandas.DataFrame
+            Exported rows.
+        """
+        return columns_to_pandas(self.to_columns(properties), self._get_row_ids())
+
+    def to_arrow(self, properties: list = None):
+        """
+        Export the rows as pyarrow Table.
+
+
+        Arguments
+        ---------
+        properties : list, optional
+            IDs, slugs or names of properties to export.
+            Defaults to all properties except formulas and rollups.
+
+
+        Returns
+        -------
+        pyarrow.Table
+            Exported rows.
+        """
+        return columns_to_arrow(self.to_columns(properties))
+
 
 class CalendarQueryResult(CollectionQueryResult):
 
@@ -136,6 +384,13 @@ class CalendarQueryResult(CollectionQueryResult):
     def _get_block_ids(self, result: dict) -> list:
         return [w["items"] for w in result["weeks"]]
 
+    def _get_block_id_set(self) -> set:
+        return set(bid for items in self._block_ids for bid in items)
+
+    def _get_row_ids(self) -> list:
+        row_ids = [bid for items in self._block_ids for bid in items]
+        return list(dict.fromkeys(row_ids))
+
 
 class TableQueryResult(CollectionQueryResult):
 
@@ -4,7 +4,7 @@ import os
 import re
 import time
 import uuid
-from typing import List, Union, Optional
+from typing import List, Union, Optional, Iterator
 from urllib.parse import urljoin
 from zipfile import ZipFile
 
@@ -21,10 +21,11 @@ from notion.block.collection.basic import (
 )
 from notion.block.collection.view import CollectionView
 from notion.block.types import get_block_type, get_collection_view_type
+from notion.hub import HubMonitor
 from notion.logger import logger
 from notion.monitor import Monitor
 from notion.operations import operation_update_last_edited, build_operations
-from notion.settings import API_BASE_URL
+from notion.settings import API_BASE_URL, PAGE_CHUNK_LIMIT
 from notion.space import NotionSpace
 from notion.store import RecordStore
 from notion.user import NotionUser
@@ -76,9 +77,27 @@ class Transaction:
             return
 
         self.client._transaction_operations = []
+        self.client._pending_schema_options = {}
         self.client._pages_to_refresh = []
         self.client._blocks_to_refresh = []
 
+    def _get_schema_operations(self, schema_options: dict) -> list:
+        operations = []
+
+        for collection_id, options in schema_options.items():
+            collection = self.client.get_collection(collection_id)
+            operations.append(
+                build_operations(
+                    record_id=collection_id,
+                    path="schema",
+                    args=collection._get_schema_with_options(options),
+                    command="set",
+                    table="collection",
+                )
+            )
+
+        return operations
+
     def __exit__(self, exc_type, exc_value, traceback):
         if self._is_nested:
             return
@@ -86,7 +105,13 @@ class Transaction:
         operations = getattr(self.client, "_transaction_operations")
         delattr(self.client, "_transaction_operations")
 
+        schema_options = getattr(self.client, "_pending_schema_options")
+        delattr(self.client, "_pending_schema_options")
+
         if not exc_type:
+            # new select options go first, in one schema update per collection
+            operations = self._get_schema_operations(schema_options) + operations
+
             # submit the transaction if there was no exception
             self.client.submit_transaction(operations=operations)
 
@@ -109,6 +134,8 @@ class NotionClient:
         start_monitoring: bool = False,
         enable_caching: bool = False,
         cache_key: str = "",
+        monitor_transport: str = "polling",
+        monitor_hub: str = "",
     ):
         """
         Create NotionClient object and fill its fields.
@@ -139,6 +166,17 @@ class NotionClient:
             The key string used for storing all cached data in file.
             This option takes effect only when `enable_caching` is True.
             Defaults to SHA256 of token_v2.
+
+        monitor_transport : str, optional
+            Transport used by the monitor, "polling" or "websocket".
+            This option takes effect only when `enable_monitoring` is True.
+            Defaults to "polling".
+
+        monitor_hub : str, optional
+            Address of a `MonitorHub` run by another process. If passed,
+            the changes are taken from the hub instead of polling Notion.
+            This option takes effect only when `enable_monitoring` is True.
+            Defaults to empty string.
         """
         self.session = self._create_session(token_v2)
 
@@ -149,7 +187,10 @@ class NotionClient:
 
         self._monitor = None
         if enable_monitoring:
-            self._monitor = Monitor(self)
+            if monitor_hub:
+                self._monitor = HubMonitor(self, address=monitor_hub)
+            else:
+                self._monitor = Monitor(self, transport=monitor_transport)
             if start_monitoring:
                 self.start_monitoring()
 
@@ -285,7 +326,11 @@ class NotionClient:
         return [self.get_block(bid) for bid in blocks]
 
     def get_record_data(
-        self, table: str, url_or_id: str, force_refresh: bool = False
+        self,
+        table: str,
+        url_or_id: str,
+        force_refresh: bool = False,
+        fetch_subtree: bool = False,
     ) -> dict:
         """
         Get record data.
@@ -303,6 +348,13 @@ class NotionClient:
             Whether or not to force a refresh of data.
             Defaults to False.
 
+        fetch_subtree : bool, optional
+            Whether or not to load the whole page surrounding
+            the block instead of just the single record when refreshing.
+            Blocks fetched for the first time always come with their page.
+            This option takes effect only for blocks.
+            Defaults to False.
+
 
         Returns
         -------
@@ -310,10 +362,18 @@ class NotionClient:
             Record data.
         """
         return self._store.get(
-            table=table, url_or_id=url_or_id, force_refresh=force_refresh
+            table=table,
+            url_or_id=url_or_id,
+            force_refresh=force_refresh,
+            fetch_subtree=fetch_subtree,
         )
 
-    def get_block(self, url_or_id: str, force_refresh: bool = False) -> Optional[Block]:
+    def get_block(
+        self,
+        url_or_id: str,
+        force_refresh: bool = False,
+        fetch_subtree: bool = False,
+    ) -> Optional[Block]:
         """
         Retrieve an instance of a subclass of Block that maps to
         the block/page identified by the URL or ID passed in.
@@ -328,6 +388,12 @@ class NotionClient:
             Whether or not to force a refresh of data.
             Defaults to False.
 
+        fetch_subtree : bool, optional
+            Whether or not to load the whole page with all of its children
+            in one go when refreshing, instead of just the block.
+            Blocks fetched for the first time always come with their page.
+            Defaults to False.
+
 
         Returns
         -------
@@ -335,7 +401,9 @@ class NotionClient:
             Found block or None.
         """
         block_id = extract_id(url_or_id)
-        block = self.get_record_data("block", block_id, force_refresh)
+        block = self.get_record_data(
+            "block", block_id, force_refresh, fetch_subtree=fetch_subtree
+        )
 
         if not block:
             return None
@@ -350,6 +418,45 @@ class NotionClient:
 
         return klass(client=self, block_id=block_id)
 
+    def iter_page_blocks(
+        self, url_or_id: str, chunk_size: int = PAGE_CHUNK_LIMIT
+    ) -> Iterator[Block]:
+        """
+        Load the page identified by the URL or ID passed in
+        chunk by chunk and yield its blocks as soon as they arrive.
+
+        Blocks are yielded in the order returned by the server,
+        each one only once even if it shows up in many chunks.
+
+
+        Arguments
+        ---------
+        url_or_id : str
+            Path or ID to the page.
+
+        chunk_size : int, optional
+            Max number of records to fetch per request.
+            Defaults to PAGE_CHUNK_LIMIT.
+
+
+        Returns
+        -------
+        Iterator[Block]
+            Blocks of the page.
+        """
+        page_id = extract_id(url_or_id)
+        seen = set()
+
+        for block_ids in self._store.iter_load_page_chunk(page_id, chunk_size):
+            for block_id in block_ids:
+                if block_id in seen:
+                    continue
+
+                seen.add(block_id)
+                block = self.get_block(block_id)
+                if block:
+                    yield block
+
     def get_collection(
         self, collection_id: str, force_refresh: bool = False
     ) -> Optional[CollectionBlock]:
@@ -532,15 +639,26 @@ class NotionClient:
         """
         Refresh collection rows.
 
+        The rows come back together with the list of their IDs,
+        but only those with a newer version than the cached one are stored.
+
 
         Arguments
         ---------
         collection_id : str
             ID of the collection.
         """
+        # called on monitor's "collection/<id>" notifications,
+        # so whatever was cached for the collection is outdated now
+        self._store.invalidate_query_cache(collection_id)
         collection = self.get_collection(collection_id)
-        row_ids = [row.id for row in collection.get_rows()]
-        self._store.set_collection_rows(collection_id, row_ids)
+        result = self._store.call_query_collection(
+            collection_id=collection_id,
+            collection_view_id=collection._get_a_collection_view().id,
+            use_cache=False,
+            only_newer=True,
+        )
+        self._store.set_collection_rows(collection_id, result["blockIds"])
 
     def download_block(
         self,
@@ -676,8 +794,8 @@ class NotionClient:
         endpoint : str
             Notion's endpoint to aim at.
 
-        data : dict
-            Data to send.
+        data : dict or bytes
+            Data to send, or JSON already serialized into bytes.
             Defaults to empty dict.
 
         kwargs : dict
@@ -703,7 +821,12 @@ class NotionClient:
             Whatever API sent back.
         """
         url = self._maybe_prefix_url(endpoint)
-        resp = self.session.post(url, json=data or {}, **kwargs)
+        if isinstance(data, bytes):
+            headers = {"Content-Type": "application/json"}
+            resp = self.session.post(url, data=data, headers=headers, **kwargs)
+        else:
+            resp = self.session.post(url, json=data or {}, **kwargs)
+
         code = resp.status_code
         res_data = resp.json()
 
@@ -741,7 +864,8 @@ class NotionClient:
 
         operations = to_list(operations)
 
-        if update_last_edited:
+        # when in transaction, it's done once for all blocks when it's submitted
+        if update_last_edited and not self.in_transaction():
             updated_blocks = set(
                 [op["id"] for op in operations if op["table"] == "block"]
             )
@@ -869,7 +993,9 @@ class NotionClient:
 
         return [self.get_block(bid) for bid in data["results"]]
 
-    def create_record(self, table: str, parent: Block, **kwargs) -> str:
+    def create_record(
+        self, table: str, parent: Block, record_id: str = None, **kwargs
+    ) -> str:
         """
         Create new record.
 
@@ -882,6 +1008,10 @@ class NotionClient:
         parent : Block
             Parent for the newly created record.
 
+        record_id : str, optional
+            ID for the new record.
+            Defaults to random UUID string.
+
 
         Returns
         -------
@@ -889,7 +1019,7 @@ class NotionClient:
             ID of newly created record.
         """
         # make up a new UUID; apparently we get to choose our own!
-        record_id = str(uuid.uuid4())
+        record_id = record_id or str(uuid.uuid4())
         child_list_key = kwargs.get("child_list_key") or parent._child_list_key
 
         args = {
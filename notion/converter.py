@@ -34,12 +34,17 @@ class BaseConverter:
 
     @classmethod
     def _get_converter_for_type(cls, type_: str) -> Callable:
-        if not cls._converters:
-            cls._converters = [m for m in dir(cls) if m.startswith("convert_")]
+        # look only at this class' own cache, not the one inherited from a parent
+        converters = cls.__dict__.get("_converters")
+        if converters is None:
+            converters = {
+                m[len("convert_") :]: getattr(cls, m)
+                for m in dir(cls)
+                if m.startswith("convert_")
+            }
+            cls._converters = converters
 
-        method_name = f"convert_{type_}"
-        if method_name in cls._converters:
-            return getattr(cls, method_name)
+        return converters.get(type_)
 
     @classmethod
     def convert(cls, name: str, value: Any, prop: dict, block) -> (str, Any):
@@ -83,6 +88,20 @@ class BaseConverter:
 
 
 class PythonToNotionConverter(BaseConverter):
+
+    _colors = [
+        "default",
+        "gray",
+        "brown",
+        "orange",
+        "yellow",
+        "green",
+        "blue",
+        "purple",
+        "pink",
+        "red",
+    ]
+
     @classmethod
     def convert_title(cls, name, value, **_):
         cls._ensure_type(name, value, str)
@@ -106,41 +125,28 @@ class PythonToNotionConverter(BaseConverter):
         if value == [None]:
             return value
 
-        options = prop["options"] = prop.get("options", [])
-        valid_options = [[p["value"].lower() for p in options]]
-        colors = [
-            "default",
-            "gray",
-            "brown",
-            "orange",
-            "yellow",
-            "green",
-            "blue",
-            "purple",
-            "pink",
-            "red",
-        ]
-
-        schema_needs_update = False
-        for i, v in enumerate(value):
-            value[i] = v = v.replace(",", "")
-            v_key = v.lower()
-
-            if v_key not in valid_options:
-                schema_needs_update = True
-                valid_options.append(v_key)
-                options.append(
-                    {"id": str(uuid1()), "value": v, "color": choice(colors)}
-                )
-
-        value = [[",".join(value)]]
-
-        if schema_needs_update:
-            schema = block.collection.get("schema")
-            schema[prop["id"]] = prop
-            block.collection.set("schema", schema)
-
-        return value
+        value = [v.replace(",", "") for v in value]
+        valid_options = {p["value"].lower() for p in prop.get("options", [])}
+        missing = [v for v in value if v.lower() not in valid_options]
+
+        if missing:
+            # options added earlier in the same transaction are not in the schema yet
+            collection = block.collection
+            pending = collection._get_pending_schema_options(prop["id"])
+            valid_options.update(p["value"].lower() for p in pending)
+
+            new_options = []
+            for v in missing:
+                if v.lower() not in valid_options:
+                    valid_options.add(v.lower())
+                    new_options.append(
+                        {"id": str(uuid1()), "value": v, "color": choice(cls._colors)}
+                    )
+
+            if new_options:
+                collection.add_schema_options(prop["id"], new_options)
+
+        return [[",".join(value)]]
 
     @classmethod
     def convert_multi_select(cls, **kwargs):
@@ -162,10 +168,10 @@ class PythonToNotionConverter(BaseConverter):
     def convert_date(cls, name, value, **_):
         cls._ensure_type(name, value, [date, datetime, NotionDate])
 
-        if isinstance(value, NotionDate):
-            return value.to_notion()
+        if not isinstance(value, NotionDate):
+            value = NotionDate(value)
 
-        return NotionDate(value)
+        return value.to_notion()
 
     @classmethod
     def convert_checkbox(cls, name, value, **_):
@@ -0,0 +1,182 @@
+import asyncio
+import threading
+import time
+from collections import defaultdict, deque
+from inspect import isawaitable
+from queue import Queue
+from typing import Callable, Hashable
+
+from notion.logger import logger
+from notion.settings import CALLBACK_QUEUE_SIZE, CALLBACK_WORKERS
+
+
+class CallbackDispatcher:
+    """
+    Run record callbacks on a bounded pool of worker threads,
+    or on an asyncio event loop.
+
+    Callbacks submitted under the same key (like a table and record ID pair)
+    run one after another in the order of submission, callbacks
+    under different keys run concurrently.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = CALLBACK_WORKERS,
+        max_pending: int = CALLBACK_QUEUE_SIZE,
+        loop: asyncio.AbstractEventLoop = None,
+    ):
+        """
+        Create CallbackDispatcher object.
+
+
+        Arguments
+        ---------
+        max_workers : int, optional
+            Number of worker threads.
+            Defaults to CALLBACK_WORKERS.
+
+        max_pending : int, optional
+            Number of callbacks which can wait for a worker,
+            submitting more blocks until some of them are done.
+            Defaults to CALLBACK_QUEUE_SIZE.
+
+        loop : asyncio.AbstractEventLoop, optional
+            If passed, callbacks are run on this event loop instead
+            of the worker threads and coroutines returned by them are awaited.
+            Defaults to None.
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.loop = loop
+
+        self._lock = threading.Condition()
+        self._local = threading.local()
+        self._queues = defaultdict(deque)
+        self._ready = Queue()
+        self._workers = []
+        self._pending = 0
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "max_pending": 0,
+            "blocked": 0,
+            "blocked_seconds": 0.0,
+        }
+
+    @property
+    def stats(self) -> dict:
+        """
+        Counters of submitted, completed and failed callbacks,
+        the current and highest number of pending ones and how many times
+        (and for how long) submitting was blocked by a full queue.
+        """
+        with self._lock:
+            return {**self._stats, "pending": self._pending}
+
+    def _start_workers(self):
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._work, daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _wait_for_space(self):
+        # callbacks submitting new callbacks must not wait for themselves
+        if getattr(self._local, "is_worker", False):
+            return
+
+        if self._pending < self.max_pending:
+            return
+
+        started = time.monotonic()
+        self._stats["blocked"] += 1
+        while self._pending >= self.max_pending:
+            self._lock.wait()
+        self._stats["blocked_seconds"] += time.monotonic() - started
+
+    def submit(self, key: Hashable, fn: Callable, *args):
+        """
+        Schedule `fn(*args)` to run after all callbacks
+        submitted earlier under the same `key`.
+        """
+        with self._lock:
+            self._wait_for_space()
+            self._pending += 1
+            self._stats["submitted"] += 1
+            self._stats["max_pending"] = max(self._stats["max_pending"], self._pending)
+
+            queue = self._queues[key]
+            queue.append((fn, args))
+            if len(queue) > 1:
+                # already scheduled, will be picked up after the previous one
+                return
+
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._schedule_async, key)
+        else:
+            self._start_workers()
+            self._ready.put(key)
+
+    def _run(self, fn: Callable, args: tuple):
+        try:
+            result = fn(*args)
+            if isawaitable(result):
+                loop = asyncio.new_event_loop()
+                try:
+                    loop.run_until_complete(result)
+                finally:
+                    loop.close()
+            return True
+        except Exception as e:
+            logger.error(f"Error while processing callback {fn}: {repr(e)}")
+            return False
+
+    def _done(self, key: Hashable, succeeded: bool) -> bool:
+        with self._lock:
+            self._pending -= 1
+            self._stats["completed" if succeeded else "failed"] += 1
+            self._lock.notify_all()
+
+            queue = self._queues[key]
+            queue.popleft()
+            if queue:
+                return True
+
+            del self._queues[key]
+            return False
+
+    def _work(self):
+        self._local.is_worker = True
+
+        while True:
+            key = self._ready.get()
+            with self._lock:
+                fn, args = self._queues[key][0]
+
+            if self._done(key, self._run(fn, args)):
+                # let other keys run before the next callback of this one
+                self._ready.put(key)
+
+    def _schedule_async(self, key: Hashable):
+        # this runs on the loop, which must never block on a full queue
+        self._local.is_worker = True
+        self.loop.create_task(self._drain_async(key))
+
+    async def _drain_async(self, key: Hashable):
+        has_more = True
+
+        while has_more:
+            with self._lock:
+                fn, args = self._queues[key][0]
+
+            try:
+                result = fn(*args)
+                if isawaitable(result):
+                    await result
+                succeeded = True
+            except Exception as e:
+                logger.error(f"Error while processing callback {fn}: {repr(e)}")
+                succeeded = False
+
+            has_more = self._done(key, succeeded)
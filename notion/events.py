@@ -0,0 +1,240 @@
+import asyncio
+import itertools
+import threading
+from collections import OrderedDict
+from typing import Any, NamedTuple
+
+from notion.settings import EVENT_QUEUE_SIZE
+from notion.utils import get_difference
+
+
+class RecordChanged(NamedTuple):
+    table: str
+    record_id: str
+    difference: list
+    old_val: Any
+    new_val: Any
+
+
+class RecordLoaded(NamedTuple):
+    table: str
+    record_id: str
+    value: Any
+
+
+class RowAdded(NamedTuple):
+    collection_id: str
+    row_id: str
+
+
+class RowRemoved(NamedTuple):
+    collection_id: str
+    row_id: str
+
+
+class EventStream:
+    """
+    Bounded queue of changes seen by the local record store,
+    consumed with a plain or an async for loop.
+    """
+
+    policies = ("block", "drop_oldest", "drop_newest", "merge")
+
+    def __init__(
+        self, store, maxsize: int = EVENT_QUEUE_SIZE, policy: str = "drop_oldest"
+    ):
+        """
+        Create EventStream object and start listening to the store.
+
+
+        Arguments
+        ---------
+        store : RecordStore
+            Store to listen to.
+
+        maxsize : int, optional
+            How many events can wait for the consumer.
+            Defaults to EVENT_QUEUE_SIZE.
+
+        policy : str, optional
+            What to do when the queue is full. "block" makes the producer
+            (usually the monitor) wait for the consumer, "drop_oldest"
+            and "drop_newest" throw events away and "merge" folds changes
+            of the same record (or row) into the queued event first
+            and blocks only when that's not possible. Changes made
+            by the consumer itself are never blocked, they're queued
+            over the limit instead.
+            Defaults to "drop_oldest".
+        """
+        if policy not in self.policies:
+            raise ValueError(f"Unsupported event stream policy: '{policy}'")
+
+        self.maxsize = maxsize
+        self.policy = policy
+        self._store = store
+        self._lock = threading.Condition()
+        self._queue = OrderedDict()
+        self._counter = itertools.count()
+        self._waiter = None
+        self._consumers = set()
+        self._closed = False
+        self._stats = {"received": 0, "delivered": 0, "dropped": 0, "merged": 0}
+
+        store.add_listener(self.put)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        event = self.get()
+        if event is None:
+            raise StopIteration
+        return event
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        loop = asyncio.get_event_loop()
+
+        while True:
+            with self._lock:
+                self._consumers.add(threading.get_ident())
+                if self._queue:
+                    return self._pop()
+                if self._closed:
+                    raise StopAsyncIteration
+                self._waiter = loop, loop.create_future()
+                waiter = self._waiter[1]
+
+            await waiter
+
+    @property
+    def stats(self) -> dict:
+        """
+        Counters of received, delivered, dropped and merged events
+        and the number of events waiting in the queue.
+        """
+        with self._lock:
+            return {**self._stats, "pending": len(self._queue)}
+
+    def _get_key(self, event):
+        if self.policy != "merge":
+            return next(self._counter)
+
+        if isinstance(event, RecordChanged):
+            return event.table, event.record_id
+
+        return event.collection_id, event.row_id
+
+    def _merge(self, key, event) -> bool:
+        queued = self._queue.get(key)
+        if queued is None:
+            return False
+
+        self._stats["merged"] += 1
+
+        if isinstance(event, RecordChanged):
+            difference = get_difference(queued.old_val, event.new_val)
+            merged = event._replace(difference=difference, old_val=queued.old_val)
+            if difference:
+                self._queue[key] = merged
+            else:
+                del self._queue[key]
+            return True
+
+        # a row added and removed again (or the other way round) is no change
+        if type(queued) is not type(event):
+            del self._queue[key]
+
+        return True
+
+    def _notify(self):
+        self._lock.notify_all()
+
+        if self._waiter is not None:
+            loop, waiter = self._waiter
+            self._waiter = None
+            loop.call_soon_threadsafe(lambda: waiter.done() or waiter.set_result(None))
+
+    def _pop(self):
+        _, event = self._queue.popitem(last=False)
+        self._stats["delivered"] += 1
+        self._lock.notify_all()
+        return event
+
+    def put(self, event):
+        """
+        Add the event to the queue, applying the policy if it's full.
+        """
+        # records seen for the first time are not changes
+        if isinstance(event, RecordLoaded):
+            return
+
+        with self._lock:
+            if self._closed:
+                return
+
+            self._stats["received"] += 1
+            key = self._get_key(event)
+
+            if self.policy == "merge" and self._merge(key, event):
+                self._notify()
+                return
+
+            if len(self._queue) >= self.maxsize:
+                if self.policy == "drop_newest":
+                    self._stats["dropped"] += 1
+                    return
+
+                if self.policy == "drop_oldest":
+                    self._queue.popitem(last=False)
+                    self._stats["dropped"] += 1
+
+                # a consumer writing back to the records must not wait for itself
+                while (
+                    len(self._queue) >= self.maxsize
+                    and not self._closed
+                    and threading.get_ident() not in self._consumers
+                ):
+                    self._lock.wait()
+
+                if self._closed:
+                    return
+
+            self._queue[key] = event
+            self._notify()
+
+    def get(self, timeout: float = None):
+        """
+        Take the next event from the queue, waiting for it if needed.
+
+
+        Arguments
+        ---------
+        timeout : float, optional
+            How many seconds to wait at most.
+            Defaults to None, meaning until there's an event or stream is closed.
+
+
+        Returns
+        -------
+        RecordChanged, RowAdded, RowRemoved or None
+            The event, or None on timeout or when the stream was closed.
+        """
+        with self._lock:
+            self._consumers.add(threading.get_ident())
+            if not self._queue and not self._closed:
+                self._lock.wait_for(lambda: self._queue or self._closed, timeout)
+
+            return self._pop() if self._queue else None
+
+    def close(self):
+        """
+        Stop listening to the store, events already queued can be still consumed.
+        """
+        self._store.remove_listener(self.put)
+
+        with self._lock:
+            self._closed = True
+            self._notify()
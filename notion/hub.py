@@ -0,0 +1,480 @@
+import hashlib
+import json
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from queue import Empty, Full, Queue
+from typing import Set
+
+from notion.events import EventStream, RecordChanged, RecordLoaded, RowAdded
+from notion.logger import logger
+from notion.record import Record
+from notion.settings import (
+    EVENT_QUEUE_SIZE,
+    MONITOR_HUB_ADDRESS,
+    MONITOR_HUB_QUEUE_SIZE,
+    SUBSCRIPTION_FLUSH_DELAY,
+)
+
+
+def _get_authkey(client) -> bytes:
+    # only processes logged in as the same user can talk to each other
+    token_v2 = client.session.cookies.get("token_v2") or ""
+    return hashlib.sha256(f"notion-py-hub:{token_v2}".encode()).digest()
+
+
+def _send_message(conn, message: dict):
+    conn.send_bytes(json.dumps(message, separators=(",", ":")).encode())
+
+
+def _receive_message(conn) -> dict:
+    return json.loads(conn.recv_bytes())
+
+
+class _RemoteRecord:
+    """
+    Record subscribed by a connected process, known to the hub
+    only by its table, ID and the newest version any process reported.
+    """
+
+    def __init__(self, store, table: str, record_id: str, version: int):
+        self._store = store
+        self._table = table
+        self.id = record_id
+        self._version = version
+
+    def get(self, path: str, default=None):
+        if path != "version":
+            return default
+
+        version = self._store.get_current_version(self._table, self.id)
+        return max(version, self._version)
+
+
+class _HubConnection:
+    """
+    Connected client process, with the records it's subscribed to
+    and the messages waiting to be sent to it.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.records = set()
+        self.queue = Queue(maxsize=MONITOR_HUB_QUEUE_SIZE)
+        self.closed = False
+
+    def wants(self, table: str, record_id: str, value) -> bool:
+        if (table, record_id) in self.records:
+            return True
+
+        # rows of subscribed collections are sent along, like the monitor
+        # refreshes them on the notifications about their collection
+        return (
+            isinstance(value, dict)
+            and value.get("parent_table") == "collection"
+            and ("collection", value.get("parent_id")) in self.records
+        )
+
+    def put(self, message: dict):
+        try:
+            self.queue.put_nowait(message)
+        except Full:
+            # it will connect again and catch up when it subscribes
+            logger.warning("Monitor hub client can't keep up, resetting it")
+            self._clear()
+            self.queue.put_nowait({"type": "reset"})
+
+    def _clear(self):
+        try:
+            while True:
+                self.queue.get_nowait()
+        except Empty:
+            pass
+
+    def close(self):
+        self.closed = True
+        self.conn.close()
+
+
+class MonitorHub:
+    """
+    Share one monitoring session among many processes.
+
+    The hub runs the monitor of its client and sends every change
+    of the records it brings in to the connected processes, over a local
+    socket, so they don't have to poll Notion and fetch the records themselves.
+    Processes connect to it by passing `monitor_hub` to `NotionClient`.
+    """
+
+    def __init__(self, client, address: str = MONITOR_HUB_ADDRESS, authkey=None):
+        """
+        Create MonitorHub object and start listening for connections.
+
+
+        Arguments
+        ---------
+        client : NotionClient
+            Client created with `enable_monitoring=True`.
+
+        address : str, optional
+            Address to listen on, a path of an unix socket,
+            a name of a windows pipe or a (host, port) tuple.
+            Defaults to MONITOR_HUB_ADDRESS.
+
+        authkey : bytes, optional
+            Key the connecting processes have to know.
+            Defaults to a key derived from the token of the client.
+        """
+        if client._monitor is None:
+            raise ValueError("MonitorHub needs a client with enable_monitoring=True")
+
+        self.client = client
+        self.address = address
+        self.thread = None
+        self._connections = []
+        self._records = {}
+        self._lock = threading.Lock()
+        self._listener = Listener(address, authkey=authkey or _get_authkey(client))
+        client._store.add_listener(self._broadcast)
+
+    def _broadcast(self, event):
+        if isinstance(event, (RecordChanged, RecordLoaded)):
+            # records the hub didn't hold yet are new only to the hub
+            if isinstance(event, RecordLoaded):
+                new_val, old_val = event.value, None
+            else:
+                new_val, old_val = event.new_val, event.old_val
+
+            new_val = new_val if isinstance(new_val, dict) else None
+            message = {
+                "type": "record",
+                "table": event.table,
+                "id": event.record_id,
+                "value": new_val,
+            }
+            values = new_val, old_val
+
+            def wants(connection):
+                return any(
+                    connection.wants(event.table, event.record_id, v) for v in values
+                )
+
+        else:
+            message = {
+                "type": "row",
+                "collection_id": event.collection_id,
+                "id": event.row_id,
+                "added": isinstance(event, RowAdded),
+            }
+
+            def wants(connection):
+                return ("collection", event.collection_id) in connection.records
+
+        with self._lock:
+            connections = list(self._connections)
+
+        for connection in connections:
+            if wants(connection):
+                connection.put(message)
+
+    def _subscribe(self, connection: _HubConnection, records: list):
+        store = self.client._store
+        new_records = []
+        stale = {}
+
+        with self._lock:
+            for table, record_id, version in records:
+                key = table, record_id
+                connection.records.add(key)
+
+                record = self._records.get(key)
+                if record is None:
+                    record = _RemoteRecord(store, table, record_id, version)
+                    self._records[key] = record
+                    new_records.append(record)
+
+                # the versions reported by processes are trusted, the hub
+                # fetches a record only when some process is behind another
+                # one and the hub itself doesn't hold the newer value
+                elif max(version, store.get_current_version(*key)) < record._version:
+                    stale.setdefault(table, []).append(record_id)
+
+                record._version = max(record._version, version)
+
+        if stale:
+            self.client.refresh_records(**stale)
+
+        for table, record_id, version in records:
+            if store.get_current_version(table, record_id) > version:
+                value = store._get(table, record_id)
+                connection.put(
+                    {
+                        "type": "record",
+                        "table": table,
+                        "id": record_id,
+                        "value": value if isinstance(value, dict) else None,
+                    }
+                )
+
+        self.client._monitor.subscribe(new_records)
+
+    def _read(self, connection: _HubConnection):
+        try:
+            while not connection.closed:
+                message = _receive_message(connection.conn)
+                if message.get("type") == "subscribe":
+                    self._subscribe(connection, message["records"])
+        except (EOFError, OSError):
+            pass
+        except Exception as e:
+            logger.error(f"Error while serving monitor hub client: {e}")
+
+        with self._lock:
+            if connection in self._connections:
+                self._connections.remove(connection)
+
+        connection.close()
+        try:
+            # wake up the writer, when the queue is full it'll notice anyway
+            connection.queue.put_nowait(None)
+        except Full:
+            pass
+
+    def _write(self, connection: _HubConnection):
+        try:
+            while not connection.closed:
+                message = connection.queue.get()
+                if message is None:
+                    break
+                _send_message(connection.conn, message)
+        except (EOFError, OSError):
+            connection.close()
+
+    def serve_forever(self):
+        """
+        Start monitoring and accept connections of client processes.
+
+        This function is blocking, it never returns!
+        """
+        self.client.start_monitoring()
+
+        while True:
+            try:
+                conn = self._listener.accept()
+            except (AuthenticationError, OSError) as e:
+                # most likely a process with a wrong key
+                logger.warning(f"Rejected monitor hub connection: {e}")
+                continue
+
+            connection = _HubConnection(conn)
+            with self._lock:
+                self._connections.append(connection)
+
+            for target in (self._read, self._write):
+                threading.Thread(target=target, args=(connection,), daemon=True).start()
+
+    def start(self):
+        """
+        Run `serve_forever()` in a background daemon thread.
+        """
+        if self.thread:
+            return
+
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+
+class HubMonitor:
+    """
+    Monitor taking the changes from a MonitorHub run by another process,
+    instead of polling Notion.
+    """
+
+    thread = None
+
+    def __init__(self, client, address: str = MONITOR_HUB_ADDRESS, authkey=None):
+        """
+        Create HubMonitor object.
+
+        The hub is connected to once monitoring starts,
+        so it doesn't have to be running yet.
+
+
+        Arguments
+        ---------
+        client : NotionClient
+            Client to use.
+
+        address : str, optional
+            Address the hub listens on.
+            Defaults to MONITOR_HUB_ADDRESS.
+
+        authkey : bytes, optional
+            Key of the hub.
+            Defaults to a key derived from the token of the client.
+        """
+        self.client = client
+        self.address = address
+        self._authkey = authkey or _get_authkey(client)
+        self._subscriptions = {}
+        self._pending_subscriptions = {}
+        self._subscriptions_lock = threading.Lock()
+        self._flush_timer = None
+        self._send_lock = threading.Lock()
+        self._conn = None
+
+    def initialize(self):
+        """
+        Connect to the hub, subscribing again to all records if reconnecting.
+        """
+        logger.debug(f"Connecting to monitor hub at {self.address}")
+
+        self.close()
+        self._conn = Client(self.address, authkey=self._authkey)
+
+        with self._subscriptions_lock:
+            self._pending_subscriptions = dict(self._subscriptions)
+
+        self.flush_subscriptions()
+
+    def close(self):
+        """
+        Close the connection to the hub, if there is one.
+        """
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def subscribe(self, records: Set[Record]):
+        """
+        Subscribe to changes of passed records.
+
+        Subscriptions are queued and sent to the hub in one batch,
+        after SUBSCRIPTION_FLUSH_DELAY seconds or on the next poll,
+        whichever comes first.
+
+
+        Arguments
+        ---------
+        records : set of Record
+            Set of `Record` objects to subscribe to.
+        """
+        if not isinstance(records, (set, list)):
+            records = [records]
+
+        with self._subscriptions_lock:
+            for record in records:
+                key = record._table, record.id
+                if key not in self._subscriptions:
+                    self._subscriptions[key] = record
+                    self._pending_subscriptions[key] = record
+
+            if not self._pending_subscriptions or self._flush_timer:
+                return
+
+            self._flush_timer = threading.Timer(
+                SUBSCRIPTION_FLUSH_DELAY, self.flush_subscriptions
+            )
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush_subscriptions(self):
+        """
+        Send all queued subscriptions to the hub right away,
+        with the versions of the records held by the local store.
+        """
+        with self._subscriptions_lock:
+            if self._flush_timer:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+
+            # when disconnected, all of them are sent after connecting again
+            if self._conn is None:
+                return
+
+            pending = self._pending_subscriptions
+            self._pending_subscriptions = {}
+
+        if not pending:
+            return
+
+        store = self.client._store
+        data = [[*key, store.get_current_version(*key)] for key in pending]
+
+        with self._send_lock:
+            _send_message(self._conn, {"type": "subscribe", "records": data})
+
+    def _apply(self, message: dict):
+        store = self.client._store
+
+        if message["type"] == "record":
+            table, record_id, value = message["table"], message["id"], message["value"]
+            if value and store._is_up_to_date(table, record_id, {"value": value}):
+                return
+            store._update_record(table, record_id, value=value)
+
+        elif message["type"] == "row":
+            collection_id = message["collection_id"]
+
+            # rows that were never loaded here are queried when they're needed
+            if collection_id not in store._collection_row_ids:
+                return
+
+            row_ids = [
+                i
+                for i in store.get_collection_rows(collection_id)
+                if i != message["id"]
+            ]
+            if message["added"]:
+                row_ids.append(message["id"])
+            store.set_collection_rows(collection_id, row_ids)
+
+        elif message["type"] == "reset":
+            # some changes were lost, subscribing again brings them in
+            self.initialize()
+
+    def events(
+        self, maxsize: int = EVENT_QUEUE_SIZE, policy: str = "drop_oldest"
+    ) -> EventStream:
+        """
+        Get a stream of changes brought in from the hub, see `Monitor.events`.
+        """
+        return EventStream(self.client._store, maxsize=maxsize, policy=policy)
+
+    def poll(self):
+        """
+        Wait for the next change from the hub and apply it to the local store,
+        connecting to the hub first if needed.
+        """
+        if self._conn is None:
+            self.initialize()
+
+        self.flush_subscriptions()
+        self._apply(_receive_message(self._conn))
+
+    def poll_async(self):
+        if self.thread:
+            return
+
+        logger.debug("Starting new thread for reading from monitor hub")
+        self.thread = threading.Thread(target=self.poll_forever, daemon=True)
+        self.thread.start()
+
+    def poll_forever(self):
+        """
+        Call `poll()` in never-ending loop, reconnecting when the hub goes away.
+
+        This function is blocking, it never returns!
+        """
+        while True:
+            try:
+                self.poll()
+            except (AuthenticationError, EOFError, OSError) as e:
+                logger.warning(f"Monitor hub connection lost, reconnecting: {e}")
+                self.close()
+                time.sleep(1)
+            except Exception as e:
+                logger.error("Encountered error while reading from monitor hub!")
+                logger.error(e, exc_info=True)
+                time.sleep(1)
@@ -1,4 +1,6 @@
+import codecs
 import json
+import os
 import re
 import threading
 import time
@@ -9,10 +11,115 @@ from urllib.parse import urlencode
 
 from requests import HTTPError
 
-from notion.block.collection.basic import CollectionBlock
+from notion.events import EventStream
 from notion.logger import logger
 from notion.record import Record
-from notion.settings import MESSAGE_STORE_URL
+from notion.settings import (
+    CHECKPOINT_DELAY,
+    COLLECTION_REFRESH_DELAY,
+    EVENT_QUEUE_SIZE,
+    MESSAGE_STORE_URL,
+    SUBSCRIPTION_FLUSH_DELAY,
+)
+
+
+def _utf16_len(text: str) -> int:
+    # engine.io counts the length of packets like javascript does
+    return len(text) + sum(1 for c in text if c > "\uffff")
+
+
+class PayloadParser:
+    """
+    Incremental parser of engine.io polling payloads,
+    made of packets prefixed with their length, like `12:4{"a":"b"}`.
+
+    Bytes can be fed in arbitrary chunks, packets which
+    are not complete yet are kept until the rest arrives.
+    """
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+
+    def _take(self, start: int, length: int) -> int:
+        """
+        Find the end of a packet `length` UTF-16 units long,
+        or return -1 if the buffer doesn't hold all of it yet.
+        """
+        candidate = self._buffer[start : start + length]
+        if _utf16_len(candidate) == len(candidate):
+            return start + length if len(candidate) == length else -1
+
+        # characters outside the BMP take two units, which is rare
+        units = 0
+        for end, char in enumerate(self._buffer[start:], start):
+            if units == length:
+                return end
+            units += 2 if char > "\uffff" else 1
+
+        return len(self._buffer) if units == length else -1
+
+    def feed(self, data: bytes) -> list:
+        """
+        Parse next chunk of the payload.
+
+
+        Arguments
+        ---------
+        data : bytes
+            Chunk of the payload.
+
+
+        Returns
+        -------
+        list of str
+            Complete packets found so far, each with its type as first character.
+        """
+        self._buffer += self._decoder.decode(data)
+        packets = []
+        pos = 0
+
+        while True:
+            colon = self._buffer.find(":", pos)
+            if colon < 0:
+                break
+
+            prefix = self._buffer[pos:colon].strip()
+            if not prefix.isdigit():
+                logger.debug(f"Could not parse monitoring payload: {self._buffer}")
+                pos = len(self._buffer)
+                break
+
+            end = self._take(colon + 1, int(prefix))
+            if end < 0:
+                break
+
+            packets.append(self._buffer[colon + 1 : end])
+            pos = end
+
+        self._buffer = self._buffer[pos:]
+        return packets
+
+
+class _CheckpointedRecord:
+    """
+    Subscribed record restored from a checkpoint,
+    it knows only its table, ID and the last seen version.
+    """
+
+    def __init__(self, store, table: str, record_id: str, version: int):
+        self._store = store
+        self._table = table
+        self.id = record_id
+        self._version = version
+
+    def get(self, path: str, default=None):
+        if path != "version":
+            return default
+
+        # the store may know a newer version, e.g. from its own cache
+        version = self._store.get_current_version(self._table, self.id)
+        return max(version, self._version)
 
 
 class Monitor:
@@ -22,7 +129,9 @@ class Monitor:
 
     thread = None
 
-    def __init__(self, client, root_url: str = MESSAGE_STORE_URL):
+    def __init__(
+        self, client, root_url: str = MESSAGE_STORE_URL, transport: str = "polling"
+    ):
         """
         Create Monitor object.
 
@@ -35,42 +144,158 @@ class Monitor:
         root_url : str, optional
             Root URL for polling message stats.
             Defaults to valid notion message store URL.
+
+        transport : str, optional
+            Either "polling" or "websocket". The websocket transport
+            needs the `websocket-client` package and falls back
+            to polling whenever the connection can't be upgraded.
+            Defaults to "polling".
         """
+        if transport not in ("polling", "websocket"):
+            raise ValueError(f"Unsupported monitor transport: '{transport}'")
+
         self.sid = None
         self.client = client
         self.root_url = root_url
+        self.transport = transport
         self.session_id = str(uuid.uuid4())
-        self._subscriptions = set()
+        self.ping_interval = 25
+        self._subscriptions = {}
+        self._pending_subscriptions = {}
+        self._subscriptions_lock = threading.Lock()
+        self._flush_timer = None
+        self._collections_to_refresh = set()
+        self._collections_lock = threading.Lock()
+        self._refresh_timer = None
+        self._websocket = None
+        self._checkpoint = {}
+        self._checkpoint_lock = threading.Lock()
+        self._checkpoint_timer = None
+        self._restore_checkpoint()
         self.initialize()
 
+    def _get_checkpoint_path(self):
+        store = self.client._store
+        return store._get_cache_path("_monitor") if store._cache_key else None
+
+    def _restore_checkpoint(self):
+        path = self._get_checkpoint_path()
+        if not path:
+            return
+
+        try:
+            with open(path) as f:
+                versions = json.load(f)["subscriptions"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return
+
+        logger.debug(f"Restoring {len(versions)} subscriptions from checkpoint")
+        self._checkpoint = versions
+
+        for name, version in versions.items():
+            table, record_id = name.split("/", 1)
+            record = _CheckpointedRecord(self.client._store, table, record_id, version)
+            self._subscriptions[table, record_id] = record
+
+            # rows added or removed while we were away don't bump any version
+            if table == "collection":
+                self._schedule_collection_refresh(record_id)
+
+    def _update_checkpoint(self, versions: dict):
+        # only the changed versions are tracked, the file is written
+        # once they settle down, not on every notification
+        if not versions or not self._get_checkpoint_path():
+            return
+
+        with self._checkpoint_lock:
+            self._checkpoint.update(versions)
+            if self._checkpoint_timer:
+                return
+
+            self._checkpoint_timer = threading.Timer(CHECKPOINT_DELAY, self.checkpoint)
+            self._checkpoint_timer.daemon = True
+            self._checkpoint_timer.start()
+
+    def checkpoint(self):
+        """
+        Save subscribed records and their last seen versions to the local cache.
+
+        After a restart they are subscribed to again with these versions,
+        so only the records which changed in the meantime get refreshed.
+        Changes are saved CHECKPOINT_DELAY seconds after they happen,
+        call this to save them right away.
+        Does nothing when the client has caching disabled.
+        """
+        path = self._get_checkpoint_path()
+        if not path:
+            return
+
+        with self._checkpoint_lock:
+            if self._checkpoint_timer:
+                self._checkpoint_timer.cancel()
+                self._checkpoint_timer = None
+
+            versions = dict(self._checkpoint)
+
+        # write it aside first, a crash must not leave a truncated checkpoint
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"subscriptions": versions}, f)
+        os.replace(f"{path}.tmp", path)
+
     @staticmethod
     def _encode_numbered_json_thing(data: list) -> bytes:
-        results = ""
-        for obj in data:
-            msg = str(len(obj)) + json.dumps(obj, separators=(",", ":"))
-            msg = f"{len(msg)}:{msg}"
-            results += msg
-
-        return results.encode()
+        packets = ["4" + json.dumps(obj, separators=(",", ":")) for obj in data]
+        return Monitor._encode_packets(packets)
 
     def _decode_numbered_json_thing(self, thing: bytes) -> list:
-        thing = thing.decode().strip()
+        results = []
 
-        for ping in re.findall(r'\d+:\d+"primus::ping::\d+"', thing):
-            logger.debug(f"Received ping: {ping}")
-            self.post_data(ping.replace("::ping::", "::pong::"))
+        for packet in self._parser.feed(thing):
+            packet_type, data = packet[:1], packet[1:]
 
-        results = []
-        for blob in re.findall(r"\d+:\d+({.+})(?=\d|$)", thing):
-            results.append(json.loads(blob))
+            # "0" opens the session, "4" is a message, the rest carry nothing
+            if packet_type not in ("0", "4") or not data:
+                logger.debug(f"Ignoring monitoring packet: {packet}")
+                continue
 
-        if thing and not results and "::ping::" not in thing:
-            logger.debug(f"Could not parse monitoring response: {thing}")
+            data = json.loads(data)
+            if isinstance(data, str) and data.startswith("primus::ping::"):
+                logger.debug(f"Received ping: {data}")
+                pong = data.replace("::ping::", "::pong::")
+                self.post_data(self._encode_packets(["4" + json.dumps(pong)]))
+                continue
+
+            results.append(data)
 
         return results
 
+    @staticmethod
+    def _encode_packets(packets: list) -> bytes:
+        return "".join(f"{_utf16_len(p)}:{p}" for p in packets).encode()
+
+    def _decode_websocket_frame(self, frame: str) -> list:
+        # every websocket frame holds exactly one engine.io packet,
+        # the first character is the packet type and there's no length prefix
+        if frame == "2":
+            self._websocket.send("3")
+            return []
+
+        if not frame.startswith("4"):
+            logger.debug(f"Ignoring websocket packet: {frame}")
+            return []
+
+        data = json.loads(frame[1:])
+        if isinstance(data, str) and data.startswith("primus::ping::"):
+            logger.debug(f"Received ping: {data}")
+            pong = data.replace("::ping::", "::pong::")
+            self._websocket.send("4" + json.dumps(pong))
+            return []
+
+        return [data]
+
     def _refresh_updated_records(self, events: list):
         records_to_refresh = defaultdict(list)
+        refreshed_versions = {}
         versions_pattern = re.compile(r"versions/([^:]+):(.+)")
         collection_pattern = re.compile(r"collection/(.+)")
 
@@ -94,6 +319,12 @@ class Monitor:
                     table=record_table, record_id=record_id
                 )
 
+                # stand-ins restored from a checkpoint or subscribed through
+                # a hub may know a version the store hasn't loaded
+                record = self._subscriptions.get((record_table, record_id))
+                if record is not None and not isinstance(record, Record):
+                    old = max(old, record.get("version", -1))
+
                 if new > old:
                     logger.debug(
                         (
@@ -102,6 +333,7 @@ class Monitor:
                         )
                     )
                     records_to_refresh[record_table].append(record_id)
+                    refreshed_versions[name] = new
                 else:
                     logger.debug(
                         (
@@ -118,19 +350,76 @@ class Monitor:
 
                 collection_id = match.groups()[0]
 
-                self.client.refresh_collection_rows(collection_id)
-                row_ids = self.client._store.get_collection_rows(collection_id)
-
                 logger.debug(
-                    (
-                        f"Something inside collection '{collection_id}' "
-                        f"has changed. Refreshing all {row_ids} rows inside it"
-                    )
+                    f"Something inside collection '{collection_id}' has changed"
                 )
 
-                records_to_refresh["block"] += row_ids
+                # cached queries are stale right away, only refetching
+                # the rows can wait for the rest of the burst
+                self.client._store.invalidate_query_cache(collection_id)
+                self._schedule_collection_refresh(collection_id)
 
         self.client.refresh_records(**records_to_refresh)
+        self._update_checkpoint(refreshed_versions)
+
+    def events(
+        self, maxsize: int = EVENT_QUEUE_SIZE, policy: str = "drop_oldest"
+    ) -> EventStream:
+        """
+        Get a stream of changes brought in by the monitor (and by local edits),
+        to consume with a plain or an async for loop, see `EventStream`.
+
+
+        Arguments
+        ---------
+        maxsize : int, optional
+            How many events can wait for the consumer.
+            Defaults to EVENT_QUEUE_SIZE.
+
+        policy : str, optional
+            One of "block", "drop_oldest", "drop_newest" or "merge",
+            what to do when the consumer can't keep up.
+            Defaults to "drop_oldest".
+
+
+        Returns
+        -------
+        EventStream
+            Stream of RecordChanged, RowAdded and RowRemoved events.
+        """
+        return EventStream(self.client._store, maxsize=maxsize, policy=policy)
+
+    def _schedule_collection_refresh(self, collection_id: str):
+        # edits come in bursts, refresh the collection once they settle down
+        with self._collections_lock:
+            self._collections_to_refresh.add(collection_id)
+            if self._refresh_timer:
+                return
+
+            self._refresh_timer = threading.Timer(
+                COLLECTION_REFRESH_DELAY, self.refresh_collections
+            )
+            self._refresh_timer.daemon = True
+            self._refresh_timer.start()
+
+    def refresh_collections(self):
+        """
+        Refresh rows of all collections which reported changes
+        since the last refresh, each of them only once.
+        """
+        with self._collections_lock:
+            if self._refresh_timer:
+                self._refresh_timer.cancel()
+                self._refresh_timer = None
+
+            collection_ids = self._collections_to_refresh
+            self._collections_to_refresh = set()
+
+        for collection_id in collection_ids:
+            try:
+                self.client.refresh_collection_rows(collection_id)
+            except Exception as e:
+                logger.error(f"Failed to refresh collection '{collection_id}': {e}")
 
     def url(self, **kwargs) -> str:
         kwargs["b64"] = 1
@@ -144,43 +433,140 @@ class Monitor:
         """
         logger.debug("Initializing new monitoring session.")
 
+        self.close()
+
+        self._parser = PayloadParser()
         content = self.client.session.get(self.url(EIO=3)).content
-        self.sid = self._decode_numbered_json_thing(content)[0]["sid"]
+        handshake = self._decode_numbered_json_thing(content)[0]
+        self.sid = handshake["sid"]
+        self.ping_interval = handshake.get("pingInterval", 25000) / 1000
 
         logger.debug(f"New monitoring session ID is: {self.sid}")
 
+        if self.transport == "websocket":
+            self._websocket = self._upgrade_to_websocket()
+
         # resubscribe to any existing subscriptions if we're reconnecting
-        old_subscriptions = self._subscriptions
-        self._subscriptions = set()
+        with self._subscriptions_lock:
+            old_subscriptions = list(self._subscriptions.values())
+            self._subscriptions = {}
+
         self.subscribe(old_subscriptions)
+        self.flush_subscriptions()
+
+    def _create_websocket(self, url: str):
+        try:
+            import websocket
+        except ImportError:
+            raise ImportError(
+                "Websocket transport requires websocket-client: "
+                "pip install websocket-client"
+            )
+
+        cookies = self.client.session.cookies.get_dict()
+        cookie = "; ".join(f"{k}={v}" for k, v in cookies.items())
+        return websocket.create_connection(
+            url, cookie=cookie, timeout=self.ping_interval
+        )
+
+    def _upgrade_to_websocket(self):
+        url = re.sub(
+            r"^http", "ws", self.url(EIO=3, sid=self.sid, transport="websocket")
+        )
+        ws = None
+
+        try:
+            ws = self._create_websocket(url)
+            ws.send("2probe")
+            if ws.recv() != "3probe":
+                raise ConnectionError("Server did not answer the websocket probe")
+            ws.send("5")
+
+        except Exception as e:
+            logger.warning(f"Falling back to polling, websocket upgrade failed: {e}")
+            if ws is not None:
+                ws.close()
+            return None
+
+        logger.debug("Monitoring session upgraded to websocket")
+        return ws
+
+    def close(self):
+        """
+        Close the websocket connection, if there is one.
+        """
+        if self._websocket is not None:
+            self._websocket.close()
+            self._websocket = None
+
+    def _send(self, messages: list):
+        if not messages:
+            return
+
+        if self._websocket is None:
+            self.post_data(self._encode_numbered_json_thing(messages))
+            return
+
+        for message in messages:
+            logger.debug(f"Sending monitoring message: {message}")
+            self._websocket.send("4" + json.dumps(message, separators=(",", ":")))
 
     def subscribe(self, records: Set[Record]):
         """
         Subscribe to changes of passed records.
 
+        Subscriptions are queued and sent in one batch,
+        after SUBSCRIPTION_FLUSH_DELAY seconds or on the next poll,
+        whichever comes first. Records are deduplicated by table and ID.
+
 
         Arguments
         ---------
         records : set of Record
             Set of `Record` objects to subscribe to.
         """
-        if isinstance(records, list):
-            records = set(records)
-
         # TODO: how to describe that you can also pass
         #       record explicitly or should we block it?
-        if not isinstance(records, set):
-            records = {records}
+        if not isinstance(records, (set, list)):
+            records = [records]
+
+        with self._subscriptions_lock:
+            for record in records:
+                key = record._table, record.id
+                if key not in self._subscriptions:
+                    self._pending_subscriptions.setdefault(key, record)
+
+            if not self._pending_subscriptions or self._flush_timer:
+                return
+
+            self._flush_timer = threading.Timer(
+                SUBSCRIPTION_FLUSH_DELAY, self.flush_subscriptions
+            )
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush_subscriptions(self):
+        """
+        Send all queued subscriptions to Notion right away.
+        """
+        with self._subscriptions_lock:
+            if self._flush_timer:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+
+            pending = self._pending_subscriptions
+            self._pending_subscriptions = {}
+
+            # save them in case we're disconnected
+            for key, record in pending.items():
+                self._subscriptions.setdefault(key, record)
 
         sub_data = []
 
-        for record in records.difference(self._subscriptions):
-            key = f"{record.id}:{record._table}"
+        for (table, record_id), record in pending.items():
+            key = f"{record_id}:{table}"
             logger.debug(f"Subscribing new record: {key}")
 
-            # save it in case we're disconnected
-            self._subscriptions.add(record)
-
             # TODO: hide that dict generation in Record class
             sub_data.append(
                 {
@@ -192,17 +578,20 @@ class Monitor:
             )
 
             # if it's a collection, subscribe to changes to its children too
-            if isinstance(record, CollectionBlock):
+            if table == "collection":
                 sub_data.append(
                     {
                         "type": "/api/v1/registerSubscription",
                         "requestId": str(uuid.uuid4()),
-                        "key": f"collection/{record.id}",
+                        "key": f"collection/{record_id}",
                         "version": -1,
                     }
                 )
 
-        self.post_data(self._encode_numbered_json_thing(sub_data))
+        self._send(sub_data)
+        self._update_checkpoint(
+            {f"{t}/{i}": r.get("version", -1) for (t, i), r in pending.items()}
+        )
 
     def post_data(self, data: bytes):
         """
@@ -220,10 +609,29 @@ class Monitor:
         logger.debug(f"Posting monitoring data: {data}")
         self.client.session.post(self.url(sid=self.sid), data=data)
 
+    def _poll_websocket(self):
+        import websocket
+
+        try:
+            frame = self._websocket.recv()
+        except websocket.WebSocketTimeoutException:
+            # nothing happened for a while, keep the session alive
+            self._websocket.send("2")
+            return
+        except (websocket.WebSocketException, OSError) as e:
+            logger.warning(f"Websocket connection lost, reconnecting: {e}")
+            self.initialize()
+            return
+
+        self._refresh_updated_records(self._decode_websocket_frame(frame))
+
     def poll(self, retries: int = 10):
         """
         Poll for changes.
 
+        Over the websocket transport waits for the next message
+        instead, for at most the ping interval of the session.
+
 
         Arguments
         ---------
@@ -238,6 +646,12 @@ class Monitor:
         HTTPError
             When GET request fails for `retries` times.
         """
+        self.flush_subscriptions()
+
+        if self._websocket is not None:
+            self._poll_websocket()
+            return
+
         logger.debug("Starting new long-poll request")
         url = self.url(EIO=3, sid=self.sid)
         response = None
@@ -125,6 +125,12 @@ class Record:
                 f"{klass.__name__}._str_fields is not an iterable or a str"
             )
 
+    def _get_callback_path(self, path: str) -> list:
+        """
+        Split the path watched by a callback into keys.
+        """
+        return path.split(".")
+
     def _convert_diff_to_changelist(self, difference: list, old_val, new_val) -> list:
         """
         Convert difference between field values into a changelist.
@@ -231,7 +237,12 @@ class Record:
         return self._client._store.get_role(self._table, self._id)
 
     def add_callback(
-        self, cb: Callable, cb_id: str = "", **extra_kwargs: dict
+        self,
+        cb: Callable,
+        cb_id: str = "",
+        coalesce: float = None,
+        paths: list = None,
+        **extra_kwargs,
     ) -> Callback:
         """
         Add callback function to listeners.
@@ -246,6 +257,17 @@ class Record:
             Identification key for the callback.
             Defaults to random UUID string.
 
+        coalesce : float, optional
+            If set, changes within this many seconds after the first one
+            are merged and the callback is called once with the net change.
+            Defaults to None.
+
+        paths : list, optional
+            Dotted paths (like "format.page_icon") the callback cares about,
+            for collection rows also property names or slugs. Changes
+            elsewhere neither call the callback nor get converted into changes.
+            Defaults to None, meaning all changes.
+
         extra_kwargs : dict, optional
             Additional information that should be passed
             to callback when executed.
@@ -258,7 +280,12 @@ class Record:
             Callback object.
         """
         cb = self._client._store.add_callback(
-            self, cb, callback_id=cb_id, extra_kwargs=extra_kwargs
+            self,
+            cb,
+            callback_id=cb_id,
+            coalesce=coalesce,
+            paths=paths,
+            **extra_kwargs,
         )
         self._callbacks.append(cb)
         return cb
@@ -354,6 +381,8 @@ class Record:
         """
         Update the cached data for this record from the server.
 
-        Data for other records may be updated as a side effect.
+        Only this single record is fetched, use
+        `NotionClient.get_block(..., fetch_subtree=True)`
+        to reload a whole page with all of its children.
         """
         self._get_record_data(force_refresh=True)
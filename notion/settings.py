@@ -8,6 +8,34 @@ SIGNED_URL_PREFIX = "https://www.notion.so/signed/"
 MESSAGE_STORE_URL = "https://msgstore.www.notion.so/primus/"
 S3_URL_PREFIX = "https://s3-us-west-2.amazonaws.com/secure.notion-static.com/"
 
+# how many records to request per API call
+PAGE_LOAD_LIMIT = 100000
+PAGE_CHUNK_LIMIT = 100
+QUERY_LIMIT = 10000
+QUERY_CACHE_SIZE = 128
+
+# how many collection rows to load per request when paging through a query
+QUERY_PAGE_SIZE = 100
+
+# seconds to gather monitor subscriptions before sending them together
+SUBSCRIPTION_FLUSH_DELAY = 0.5
+
+# seconds to gather collection notifications before refreshing the rows
+COLLECTION_REFRESH_DELAY = 1.0
+
+# seconds to gather changed versions before checkpointing the monitor
+CHECKPOINT_DELAY = 5.0
+
+# worker threads running record callbacks and how many of them can wait
+CALLBACK_WORKERS = 4
+CALLBACK_QUEUE_SIZE = 1000
+
+# how many monitor events can wait for a slow consumer
+EVENT_QUEUE_SIZE = 1000
+
+# how many messages can wait for a slow process connected to the monitor hub
+MONITOR_HUB_QUEUE_SIZE = 10000
+
 # for rendering
 EMBED_API_URL = "https://api.embed.ly/1/oembed?key=421626497c5d4fc2ae6b075189d602a2"
 CHART_API_URL = "https://chart.googleapis.com/chart?cht=tx&chl="
@@ -21,6 +49,7 @@ os.makedirs(NOTION_DATA_DIR, exist_ok=True)
 
 NOTION_LOG_FILE = str(Path(NOTION_DATA_DIR) / "notion.log")
 NOTION_CACHE_DIR = str(Path(NOTION_DATA_DIR) / "cache")
+MONITOR_HUB_ADDRESS = str(Path(NOTION_DATA_DIR) / "monitor.sock")
 os.makedirs(NOTION_CACHE_DIR, exist_ok=True)
 
 NOTION_LOG_LEVEL = os.environ.get("NOTION_LOG_LEVEL", "WARNING").upper()
@@ -1,20 +1,28 @@
 import json
-from threading import Thread
 import uuid
 from collections import defaultdict
 from typing import Callable
 from copy import deepcopy
-from inspect import signature
+from functools import lru_cache
+from inspect import Parameter, signature
 from pathlib import Path
-from threading import Lock
+from threading import Lock, Timer
 from typing import Union
 
-from dictdiffer import diff
 from tzlocal import get_localzone
 
+from notion.dispatcher import CallbackDispatcher
+from notion.events import RecordChanged, RecordLoaded, RowAdded, RowRemoved
 from notion.logger import logger
-from notion.settings import NOTION_CACHE_DIR
-from notion.utils import extract_id, to_list
+from notion.settings import (
+    NOTION_CACHE_DIR,
+    PAGE_CHUNK_LIMIT,
+    PAGE_LOAD_LIMIT,
+    QUERY_PAGE_SIZE,
+    QUERY_CACHE_SIZE,
+    QUERY_LIMIT,
+)
+from notion.utils import extract_id, get_difference, to_list
 
 
 class MissingClass:
@@ -25,12 +33,50 @@ class MissingClass:
 Missing = MissingClass()
 
 
+def _get_diff_paths(change: tuple) -> list:
+    operation, path, values = change
+    if not isinstance(path, list):
+        path = path.split(".") if path else []
+
+    # additions and removals point at the parent, with the keys in values
+    if operation in ("add", "remove") and isinstance(values, list):
+        return [path + [item[0]] for item in values]
+
+    return [path]
+
+
+def _paths_overlap(a: list, b: list) -> bool:
+    size = min(len(a), len(b))
+    return a[:size] == b[:size]
+
+
 class Callback:
-    def __init__(self, callback: Callable, record, callback_id: str = None, **kwargs):
+    def __init__(
+        self,
+        callback: Callable,
+        record,
+        callback_id: str = None,
+        coalesce: float = None,
+        paths: list = None,
+        **kwargs,
+    ):
         self.callback = callback
         self.record = record
         self.callback_id = callback_id or str(uuid.uuid4())
+        self.coalesce = coalesce
+        self.paths = None
+        if paths is not None:
+            self.paths = [record._get_callback_path(p) for p in to_list(paths)]
         self.extra_kwargs = kwargs
+        self._window_lock = Lock()
+        self._window = None
+
+        # find out once which params the callback accepts, None means all
+        params = signature(callback).parameters.values()
+        if any(p.kind == Parameter.VAR_KEYWORD for p in params):
+            self._params = None
+        else:
+            self._params = {p.name for p in params}
 
     def __call__(self, difference, old_val, new_val):
         kwargs = {}
@@ -46,23 +92,57 @@ class Callback:
 
         # trim down the passed parameters
         # to include only those the callback will accept
-        params = signature(self.callback).parameters
-        if not any(["**" in str(p) for p in params.values()]):
-            # there's no "**kwargs" in the callback signature,
-            # so remove any unaccepted params
-            for arg in kwargs.keys():
-                if arg not in params:
-                    del kwargs[arg]
-
-        # perform the callback, gracefully handling any exceptions
-        try:
-            # trigger the callback within its own thread,
-            # so it won't block others if it's long-running
-            Thread(target=self.callback, kwargs=kwargs, daemon=True).start()
-        except Exception as e:
-            logger.error(
-                f"Error while processing callback for {repr(self.record)}: {repr(e)}"
+        if self._params is not None:
+            kwargs = {k: v for k, v in kwargs.items() if k in self._params}
+
+        return self.callback(**kwargs)
+
+    def _filter_difference(self, difference: list) -> list:
+        if self.paths is None:
+            return difference
+
+        return [
+            change
+            for change in difference
+            if any(
+                _paths_overlap(path, watched)
+                for path in _get_diff_paths(change)
+                for watched in self.paths
             )
+        ]
+
+    def schedule(self, dispatcher, key, difference, old_val, new_val):
+        """
+        Hand the change over to the dispatcher, right away or,
+        when coalescing, once the window opened by the first change closes.
+        Changes outside of the watched paths are dropped before that.
+        """
+        difference = self._filter_difference(difference)
+        if not difference:
+            return
+
+        if not self.coalesce:
+            dispatcher.submit(key, self, difference, old_val, new_val)
+            return
+
+        with self._window_lock:
+            if self._window is None:
+                timer = Timer(self.coalesce, self._close_window, (dispatcher, key))
+                timer.daemon = True
+                self._window = {"old_val": old_val}
+                timer.start()
+
+            self._window["new_val"] = new_val
+
+    def _close_window(self, dispatcher, key):
+        with self._window_lock:
+            window, self._window = self._window, None
+
+        # merge all changes within the window into a single net change
+        old_val, new_val = window["old_val"], window["new_val"]
+        difference = self._filter_difference(get_difference(old_val, new_val))
+        if difference:
+            dispatcher.submit(key, self, difference, old_val, new_val)
 
     def __eq__(self, value: Union["Callback", str]) -> bool:
         if isinstance(value, str):
@@ -74,6 +154,11 @@ class Callback:
         return False
 
 
+@lru_cache(maxsize=None)
+def _get_user_timezone() -> str:
+    return str(get_localzone())
+
+
 class RecordStore:
     """
     Central Record Store.
@@ -86,11 +171,20 @@ class RecordStore:
         self._values = defaultdict(lambda: defaultdict(dict))
         self._role = defaultdict(lambda: defaultdict(str))
         self._collection_row_ids = {}
+        self._cached_collection_rows = defaultdict(set)
+        self._collection_versions = defaultdict(int)
+        self._query_cache = {}
+        self._materialized_views = defaultdict(list)
+        self._schema_indexes = {}
         self._callbacks = defaultdict(lambda: defaultdict(list))
+        self.dispatcher = CallbackDispatcher()
+        self._listeners = []
         self._records_to_refresh = {}
         self._pages_to_refresh = []
         with self._mutex:
             self._load_cache()
+            for block_id, value in self._values["block"].items():
+                self._index_collection_row(block_id, value)
 
     def _get(self, table: str, record_id: str):
         return self._values[table].get(record_id, Missing)
@@ -123,14 +217,91 @@ class RecordStore:
         with open(self._get_cache_path(attribute), "w") as f:
             json.dump(getattr(self, attribute), f)
 
+    def _index_collection_row(self, block_id, value, old_value=None):
+        old_value = old_value or {}
+        if old_value.get("parent_table") == "collection":
+            self._cached_collection_rows[old_value.get("parent_id")].discard(block_id)
+
+        if value.get("parent_table") == "collection":
+            self._cached_collection_rows[value.get("parent_id")].add(block_id)
+
+    def _bump_collection_versions(self, table, record_id, value, old_value):
+        if table == "collection":
+            self._collection_versions[record_id] += 1
+            return
+
+        parents = {
+            v.get("parent_id")
+            for v in (value, old_value)
+            if v and v.get("parent_table") == "collection"
+        }
+        for collection_id in parents:
+            self._collection_versions[collection_id] += 1
+
     def _trigger_callbacks(self, table, record_id, difference, old_val, new_val):
-        for callback_obj in self._callbacks[table][record_id]:
-            callback_obj(difference, old_val, new_val)
+        for callback_obj in list(self._callbacks[table][record_id]):
+            callback_obj.schedule(
+                self.dispatcher, (table, record_id), difference, old_val, new_val
+            )
+
+    def add_listener(self, listener: Callable):
+        """
+        Call `listener` with a RecordChanged, RowAdded or RowRemoved event
+        for every change of the records held by the store,
+        and with a RecordLoaded event for every record stored for the first time.
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _emit(self, event):
+        for listener in list(self._listeners):
+            listener(event)
+
+    def add_materialized_view(self, view):
+        self._materialized_views[view.collection.id].append(view)
+
+    def remove_materialized_view(self, view):
+        views = self._materialized_views[view.collection.id]
+        if view in views:
+            views.remove(view)
+
+    @staticmethod
+    def _update_view(update: Callable, *args):
+        # a broken view must not stop the store from taking the change
+        try:
+            update(*args)
+        except Exception as e:
+            logger.error(f"Error while updating materialized view: {repr(e)}")
+
+    def _update_materialized_views(self, table, record_id, value, old_value):
+        if table == "collection":
+            for view in list(self._materialized_views.get(record_id, ())):
+                self._update_view(view.rebuild)
+            return
+
+        parents = {
+            v.get("parent_id")
+            for v in (value, old_value)
+            if v and v.get("parent_table") == "collection"
+        }
+        for collection_id in parents:
+            for view in list(self._materialized_views.get(collection_id, ())):
+                self._update_view(view.update_row, record_id)
 
     def set_collection_rows(self, collection_id: str, row_ids):
+        old_ids = set(self.get_collection_rows(collection_id))
+        new_ids = set(row_ids)
+
+        for view in list(self._materialized_views.get(collection_id, ())):
+            for i in old_ids - new_ids:
+                self._update_view(view.remove_row, i)
+            for i in new_ids - old_ids:
+                self._update_view(view.update_row, i)
+
         if collection_id in self._collection_row_ids:
-            old_ids = set(self.get_collection_rows(collection_id))
-            new_ids = set(row_ids)
             args = {
                 "table": "collection",
                 "record_id": collection_id,
@@ -141,28 +312,56 @@ class RecordStore:
             for i in new_ids - old_ids:
                 args["difference"] = [("row_added", "rows", i)]
                 self._trigger_callbacks(**args)
+                self._emit(RowAdded(collection_id, i))
 
             for i in old_ids - new_ids:
                 args["difference"] = [("row_removed", "rows", i)]
                 self._trigger_callbacks(**args)
+                self._emit(RowRemoved(collection_id, i))
 
         self._collection_row_ids[collection_id] = row_ids
+        self._collection_versions[collection_id] += 1
         self._save_cache("_collection_row_ids")
 
     def get_collection_rows(self, collection_id):
         return self._collection_row_ids.get(collection_id, [])
 
+    def get_collection_version(self, collection_id: str) -> int:
+        """
+        Get a counter which changes every time the collection record,
+        its list of rows or any of its rows held in the local record store
+        is changed, for example by the monitor or a submitted transaction.
+        """
+        return self._collection_versions[collection_id]
+
+    def get_cached_collection_rows(self, collection_id) -> list:
+        """
+        Get IDs of all alive, non-template rows of the collection
+        which are currently held in the local record store.
+        """
+        row_ids = []
+
+        for block_id in list(self._cached_collection_rows.get(collection_id, ())):
+            value = self._get("block", block_id)
+            if value and value.get("alive") and not value.get("is_template"):
+                row_ids.append(block_id)
+
+        return row_ids
+
     def get_role(self, table, record_id, force_refresh=False):
         self.get(table, record_id, force_refresh=force_refresh)
         return self._role[table].get(id, None)
 
-    def get(self, table, url_or_id, force_refresh=False):
+    def get(self, table, url_or_id, force_refresh=False, fetch_subtree=False):
         rid = extract_id(url_or_id)
         # look up the record in the current local dataset
         result = self._get(table, rid)
         # if it's not found, try refreshing the record from the server
         if result is Missing or force_refresh:
-            if table == "block":
+            # a block seen for the first time comes with its whole page,
+            # so its children don't need a request each, refreshes
+            # fetch just the single record unless asked otherwise
+            if table == "block" and (fetch_subtree or result is Missing):
                 self.call_load_page_chunk(rid)
             else:
                 self.call_get_record_values(**{table: rid})
@@ -170,14 +369,25 @@ class RecordStore:
         return result if result is not Missing else None
 
     def add_callback(
-        self, record, callback: Callable, callback_id=None, **extra_kwargs
+        self,
+        record,
+        callback: Callable,
+        callback_id=None,
+        coalesce: float = None,
+        paths: list = None,
+        **extra_kwargs,
     ):
         if not callable(callback):
             raise ValueError(f"The callback {callback} must be a callable.")
 
         self.remove_callbacks(record._table, record.id, callback_id)
         callback_obj = Callback(
-            callback, record, callback_id=callback_id, extra_kwargs=extra_kwargs
+            callback,
+            record,
+            callback_id=callback_id,
+            coalesce=coalesce,
+            paths=paths,
+            **extra_kwargs,
         )
         self._callbacks[record._table][record.id].append(callback_obj)
         return callback_obj
@@ -198,6 +408,8 @@ class RecordStore:
 
     def _update_record(self, table, record_id, value=None, role=None):
         callback_queue = []
+        view_updates = []
+        loaded = []
 
         with self._mutex:
             if role:
@@ -210,16 +422,18 @@ class RecordStore:
                     f"Updating 'value' for '{table}/{record_id}' to \n{p_value}"
                 )
                 old_val = self._values[table][record_id]
-                difference = list(
-                    diff(
-                        old_val,
-                        value,
-                        ignore=["version", "last_edited_time", "last_edited_by"],
-                        expand=True,
-                    )
-                )
+                difference = get_difference(old_val, value)
                 self._values[table][record_id] = value
                 self._save_cache("_values")
+                if table == "block":
+                    self._index_collection_row(record_id, value, old_val)
+                if table == "collection":
+                    self._schema_indexes.pop(record_id, None)
+                if not old_val or difference:
+                    self._bump_collection_versions(table, record_id, value, old_val)
+                    view_updates.append((table, record_id, value, old_val))
+                if not old_val:
+                    loaded.append((table, record_id, value))
                 if old_val and difference:
                     p_difference = json.dumps(value, indent=2)
                     logger.debug(f"Value changed! Difference:\n{p_difference}")
@@ -227,8 +441,37 @@ class RecordStore:
                     callback_queue.append(callback)
 
         # run callbacks outside the mutex to avoid lockups
+        for update in view_updates:
+            self._update_materialized_views(*update)
+
         for cb in callback_queue:
             self._trigger_callbacks(*cb)
+            self._emit(RecordChanged(*cb))
+
+        for args in loaded:
+            self._emit(RecordLoaded(*args))
+
+    def _remove_record(self, table, record_id):
+        """
+        Forget a record held only locally, for example one which
+        failed to be created, dropping it from the indexes and views.
+        """
+        with self._mutex:
+            old_val = self._values[table].pop(record_id, None)
+            if not old_val:
+                return
+
+            self._save_cache("_values")
+            if table == "block":
+                self._index_collection_row(record_id, {}, old_val)
+            if table == "collection":
+                self._schema_indexes.pop(record_id, None)
+            self._bump_collection_versions(table, record_id, None, old_val)
+
+        if old_val.get("parent_table") == "collection":
+            views = self._materialized_views.get(old_val.get("parent_id"), ())
+            for view in list(views):
+                self._update_view(view.remove_row, record_id)
 
     def call_get_record_values(self, **kwargs):
         """
@@ -277,25 +520,60 @@ class RecordStore:
 
         return -1
 
-    def call_load_page_chunk(self, page_id):
+    def _is_up_to_date(self, table: str, record_id: str, record: dict) -> bool:
+        version = (record.get("value") or {}).get("version")
+        current = self.get_current_version(table, record_id)
+        return version is not None and current >= version
+
+    def call_load_page_chunk(self, page_id, limit=PAGE_LOAD_LIMIT):
+        """
+        Call the server's loadPageChunk endpoint
+        to load the whole page into the local record store.
+        By default the page comes in a single request, with a smaller
+        `limit` it's fetched in chunks following the cursor returned
+        by the server, use `iter_load_page_chunk` to stream them.
+        """
+        for _ in self.iter_load_page_chunk(page_id, limit=limit):
+            pass
+
+    def iter_load_page_chunk(self, page_id, limit=PAGE_CHUNK_LIMIT):
+        """
+        Same as `call_load_page_chunk` but lazy, yields the list
+        of block IDs stored from each chunk right after it arrives.
+        """
         if self._client.in_transaction():
             self._pages_to_refresh.append(page_id)
             return
 
-        data = {
-            "pageId": page_id,
-            "limit": 100000,
-            "cursor": {"stack": []},
-            "chunkNumber": 0,
-            "verticalColumns": False,
-        }
-        data = self._client.post("loadPageChunk", data).json()
-        self.store_record_map(data)
+        cursor = {"stack": []}
+        chunk_number = 0
+
+        while True:
+            data = {
+                "pageId": page_id,
+                "limit": limit,
+                "cursor": cursor,
+                "chunkNumber": chunk_number,
+                "verticalColumns": False,
+            }
+            data = self._client.post("loadPageChunk", data).json()
+            record_map = self.store_record_map(data)
+
+            yield list(record_map.get("block", {}).keys())
 
-    def store_record_map(self, data: dict) -> dict:
+            cursor = data.get("cursor") or {}
+            if not cursor.get("stack"):
+                break
+
+            chunk_number += 1
+
+    def store_record_map(self, data: dict, only_newer: bool = False) -> dict:
         data = data["recordMap"]
         for table, records in data.items():
             for record_id, record in records.items():
+                if only_newer and self._is_up_to_date(table, record_id, record):
+                    continue
+
                 self._update_record(
                     table=table,
                     record_id=record_id,
@@ -304,8 +582,8 @@ class RecordStore:
                 )
         return data
 
-    def call_query_collection(
-        self,
+    @staticmethod
+    def _build_query_collection_data(
         collection_id: str,
         collection_view_id: str,
         search: str = "",
@@ -317,7 +595,8 @@ class RecordStore:
         sort: list = [],
         calendar_by: str = "",
         group_by: str = "",
-    ):
+        limit: int = QUERY_LIMIT,
+    ) -> dict:
         # TODO: No idea what this is.
 
         if aggregate and aggregations:
@@ -330,15 +609,15 @@ class RecordStore:
         filter = to_list(filter or {})
         sort = to_list(sort or [])
 
-        data = {
+        return {
             "collectionId": collection_id,
             "collectionViewId": collection_view_id,
             "loader": {
-                "limit": 10000,
+                "limit": limit,
                 "loadContentCover": True,
                 "searchQuery": search,
                 "userLocale": "en",
-                "userTimeZone": str(get_localzone()),
+                "userTimeZone": _get_user_timezone(),
                 "type": type,
             },
             "query": {
@@ -351,11 +630,122 @@ class RecordStore:
                 "sort": sort,
             },
         }
+
+    def _is_monitoring(self) -> bool:
+        monitor = getattr(self._client, "_monitor", None)
+        return monitor is not None and monitor.thread is not None
+
+    def invalidate_query_cache(self, collection_id: str = None):
+        """
+        Drop cached query results of the collection,
+        or of all collections if `collection_id` is None.
+        """
+        with self._mutex:
+            for key, (cid, _, _) in list(self._query_cache.items()):
+                if collection_id is None or cid == collection_id:
+                    del self._query_cache[key]
+
+    def call_query_collection(
+        self, use_cache: bool = None, only_newer: bool = False, **kwargs
+    ) -> dict:
+        """
+        Call the server's queryCollection endpoint
+        to update the local record store.
+        The keyword arguments are described in `_build_query_collection_data`.
+
+        Results are cached per query and reused for as long as
+        the collection version stays the same and no `collection/<id>`
+        notification arrives. By default (`use_cache=None`) that happens
+        only while the monitor is polling, because without it
+        the store never learns about changes made by others.
+
+        With `only_newer` the returned records are stored only
+        if their version is newer than the one held by the store.
+        """
+        data = self._build_query_collection_data(**kwargs)
+        collection_id = data["collectionId"]
+
+        if use_cache is None:
+            use_cache = self._is_monitoring()
+
+        if not use_cache:
+            return self._post_query_collection(data, only_newer)
+
+        key = json.dumps(data, sort_keys=True)
+        return self._cached_query_collection(key, collection_id, data, only_newer)
+
+    def _cached_query_collection(
+        self,
+        key: Union[str, bytes],
+        collection_id: str,
+        data: Union[dict, bytes],
+        only_newer: bool = False,
+    ) -> dict:
+        cid, version, result = self._query_cache.get(key, (None, None, None))
+        if result is not None and version == self.get_collection_version(cid):
+            return {**result}
+
+        result = self._post_query_collection(data, only_newer)
+        version = self.get_collection_version(collection_id)
+
+        with self._mutex:
+            self._query_cache.pop(key, None)
+            self._query_cache[key] = collection_id, version, result
+            # dicts keep insertion order, so the first key is the oldest one
+            if len(self._query_cache) > QUERY_CACHE_SIZE:
+                del self._query_cache[next(iter(self._query_cache))]
+
+        return {**result}
+
+    def _post_query_collection(
+        self, data: Union[dict, bytes], only_newer: bool = False
+    ) -> dict:
         data = self._client.post("queryCollection", data).json()
-        self.store_record_map(data)
+        self.store_record_map(data, only_newer=only_newer)
 
         return data["result"]
 
+    def iter_query_collection(self, page_size: int = QUERY_PAGE_SIZE, **kwargs):
+        """
+        Same as `call_query_collection` but lazy and not capped at `limit`,
+        yields pairs of (list of row IDs, query result) page by page.
+
+        The queryCollection loader has no notion of an offset, so the list
+        of matching row IDs is asked for again with a bigger limit until
+        it comes back shorter than the limit or reaches the reported total.
+        The rows themselves are loaded with getRecordValues, `page_size`
+        of them at a time, only the first page is kept from the query response.
+        """
+        limit = kwargs.pop("limit", QUERY_LIMIT)
+
+        while True:
+            data = self._build_query_collection_data(limit=limit, **kwargs)
+            data = self._client.post("queryCollection", data).json()
+            result = data["result"]
+            block_ids = result.get("blockIds", [])
+            total = result.get("total")
+
+            if len(block_ids) < limit:
+                break
+
+            if total is not None and len(block_ids) >= total:
+                break
+
+            limit = total if total and total > limit else limit * 2
+
+        first_page = set(block_ids[:page_size])
+        blocks = data["recordMap"].get("block", {})
+        for block_id in set(blocks) - first_page:
+            del blocks[block_id]
+
+        self.store_record_map(data)
+
+        for start in range(0, len(block_ids), page_size):
+            page_ids = block_ids[start : start + page_size]
+            if start:
+                self.call_get_record_values(block=page_ids)
+            yield page_ids, result
+
     def handle_post_transaction_refreshing(self):
         for block_id in self._pages_to_refresh:
             self.call_load_page_chunk(block_id)
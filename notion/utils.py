@@ -4,6 +4,7 @@ from datetime import datetime
 from typing import Any, Optional, Iterator
 from urllib.parse import urlparse, parse_qs, quote_plus, unquote_plus
 
+from dictdiffer import diff
 from slugify import slugify as _dash_slugify
 
 from notion.settings import (
@@ -273,6 +274,39 @@ def split_on_dot(path: str) -> Iterator[str]:
     yield path
 
 
+# fields which change on every edit and aren't worth a notification
+_ignored_fields = ["version", "last_edited_time", "last_edited_by"]
+
+
+def get_difference(old_val: Any, new_val: Any) -> list:
+    """
+    Get changes between two values of a record.
+
+
+    Arguments
+    ---------
+    old_val : Any
+        Previous value, a dict or a set of collection row IDs.
+
+    new_val : Any
+        Current value, of the same type.
+
+
+    Returns
+    -------
+    list
+        Changes in the format of `dictdiffer.diff`, or "row_added"
+        and "row_removed" entries for sets of collection rows.
+    """
+    if isinstance(old_val, set):
+        # collection rows, in the same format as in `set_collection_rows`
+        added = [("row_added", "rows", i) for i in new_val - old_val]
+        removed = [("row_removed", "rows", i) for i in old_val - new_val]
+        return added + removed
+
+    return list(diff(old_val, new_val, ignore=_ignored_fields, expand=True))
+
+
 def get_by_path(path: str, obj: Any, default: Any = None) -> Any:
     """
     Get value from object's key by dotted path (i.e. "path.to.0.some.key").
@@ -32,6 +32,10 @@ setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     install_requires=install_requires,
+    extras_require={
+        "columnar": ["numpy", "pandas", "pyarrow"],
+        "websocket": ["websocket-client"],
+    },
     include_package_data=True,
     packages=packages,
     python_requires=">=3.6",
@@ -1,2 +1,42 @@
+from types import SimpleNamespace
+
+from notion.client import NotionClient
+from notion.settings import PAGE_LOAD_LIMIT
+
+PAGE = "11111111-1111-1111-1111-111111111111"
+CHILD = "22222222-2222-2222-2222-222222222222"
+
+
 def test_block():
     pass
+
+
+def test_page_is_loaded_with_its_children():
+    client = NotionClient()
+    requests = []
+    limits = []
+    record_map = {
+        "block": {
+            PAGE: {"value": {"id": PAGE, "type": "page", "content": [CHILD]}},
+            CHILD: {"value": {"id": CHILD, "type": "text", "parent_id": PAGE}},
+        }
+    }
+
+    def post(endpoint, data=None):
+        requests.append(endpoint)
+        limits.append((data or {}).get("limit"))
+        results = list(record_map["block"].values())[:1]
+        response = {"recordMap": record_map, "cursor": {}, "results": results}
+        return SimpleNamespace(json=lambda: response)
+
+    client.post = post
+
+    page = client.get_block(PAGE)
+    assert client.get_block(CHILD).id == CHILD
+    assert requests == ["loadPageChunk"]
+    assert limits == [PAGE_LOAD_LIMIT]
+
+    # refreshing fetches just the single record
+    client.get_block(PAGE, force_refresh=True)
+    assert requests == ["loadPageChunk", "getRecordValues"]
+    assert page.get("content") == [CHILD]
@@ -0,0 +1,452 @@
+import time
+from copy import deepcopy
+from types import SimpleNamespace
+
+import pytest
+
+from notion.block.collection.basic import CollectionRowBlock
+from notion.block.collection.query import CollectionQuery, CollectionQueryResult
+from notion.client import NotionClient
+
+COLLECTION_ID = "44444444-4444-4444-4444-444444444444"
+IDS = [
+    "11111111-1111-1111-1111-111111111111",
+    "22222222-2222-2222-2222-222222222222",
+    "33333333-3333-3333-3333-333333333333",
+]
+
+
+def get_result(ids=IDS):
+    client = SimpleNamespace(_monitor=None)
+    collection = SimpleNamespace(_client=client, id="collection")
+    query = SimpleNamespace(aggregate=[], aggregations=[])
+    return CollectionQueryResult(collection, {"blockIds": ids}, query)
+
+
+def test_query_result_indexing():
+    result = get_result()
+
+    assert len(result) == 3
+    assert result[1].id == IDS[1]
+    assert result[-1].id == IDS[-1]
+    assert [row.id for row in result[:2]] == IDS[:2]
+    assert [row.id for row in reversed(result)] == IDS[::-1]
+    assert IDS[2] in result
+    assert "44444444-4444-4444-4444-444444444444" not in result
+
+
+def get_client():
+    client = NotionClient()
+    client.current_user = SimpleNamespace(id=IDS[0])
+    client.requests = []
+    client.post = lambda endpoint, data=None: client.requests.append((endpoint, data))
+    return client
+
+
+def get_local_query(rows, client=None, **kwargs):
+    client = client or get_client()
+    store = client._store
+
+    schema = {
+        "title": {"name": "Name", "type": "title"},
+        "num": {"name": "Value", "type": "number"},
+        "sel": {"name": "Category", "type": "select"},
+    }
+    store._update_record("collection", COLLECTION_ID, value={"schema": schema})
+    for row_id, (name, value, category) in zip(IDS, rows):
+        # notion leaves empty properties out of the record
+        properties = {
+            prop_id: [[str(v)]]
+            for prop_id, v in (("title", name), ("num", value), ("sel", category))
+            if v is not None
+        }
+        store._update_record(
+            "block",
+            row_id,
+            value={
+                "id": row_id,
+                "alive": True,
+                "parent_id": COLLECTION_ID,
+                "parent_table": "collection",
+                "properties": properties,
+            },
+        )
+
+    view = SimpleNamespace(id="view", get=lambda path, default=None: IDS)
+    collection = client.get_collection(COLLECTION_ID)
+    return CollectionQuery(collection, view, **kwargs)
+
+
+def test_local_query():
+    rows = [("apple", 3, "A"), ("banana", None, "B"), ("cherry", 10, "A")]
+
+    query = get_local_query(
+        rows,
+        filter={
+            "filters": [
+                {
+                    "property": "category",
+                    "filter": {
+                        "operator": "enum_is",
+                        "value": {"type": "exact", "value": "A"},
+                    },
+                }
+            ],
+            "operator": "and",
+        },
+        sort=[{"property": "value", "direction": "descending"}],
+        aggregations=[{"property": "value", "aggregator": "sum", "id": "total"}],
+    )
+    result = query.execute(local=True)
+
+    assert [row.id for row in result] == [IDS[2], IDS[0]]
+    assert result.get_aggregate("total") == 13
+
+    result = get_local_query(rows, search="an").execute(local=True)
+    assert [row.id for row in result] == [IDS[1]]
+
+    sort = [{"property": "value", "direction": "ascending"}]
+    result = get_local_query(rows, sort=sort).execute(local=True)
+    assert [row.id for row in result] == [IDS[0], IDS[2], IDS[1]]
+
+
+def test_local_query_with_sparse_rows():
+    rows = [("apple", 3, "A"), (None, None, None)]
+
+    result = get_local_query(rows, search="app").execute(local=True)
+    assert [row.id for row in result] == [IDS[0]]
+
+    empty = {"property": "name", "filter": {"operator": "is_empty"}}
+    result = get_local_query(rows, filter=empty).execute(local=True)
+    assert [row.id for row in result] == [IDS[1]]
+
+
+def test_to_columns():
+    np = pytest.importorskip("numpy")
+    rows = [("apple", 3, "A"), (None, None, "B"), ("cherry", 10, "A")]
+
+    query = get_local_query(rows)
+    store = query.collection._client._store
+    collection = store._get("collection", COLLECTION_ID)
+    schema = {**collection["schema"], "due": {"name": "Due", "type": "date"}}
+    store._update_record("collection", COLLECTION_ID, value={"schema": schema})
+    record = store._get("block", IDS[0])
+    date = [["‣", [["d", {"type": "date", "start_date": "2020-01-02"}]]]]
+    record = {**record, "properties": {**record["properties"], "due": date}}
+    store._update_record("block", IDS[0], value=record)
+
+    result = query.execute(local=True)
+    columns = result.to_columns()
+
+    assert list(columns["name"]) == ["apple", None, "cherry"]
+    assert np.isnan(columns["value"][1])
+    assert columns["value"][[0, 2]].tolist() == [3, 10]
+    assert columns["category"].codes.tolist() == [0, 1, 0]
+    assert columns["category"].categories == ["A", "B"]
+    assert str(columns["due"][0]) == "2020-01-02T00:00:00"
+    assert np.isnat(columns["due"][1])
+
+    pytest.importorskip("pandas")
+    df = result.to_pandas(["value", "category"])
+    assert df["value"].sum() == 13
+    assert df.loc[IDS[1], "category"] == "B"
+
+    pytest.importorskip("pyarrow")
+    table = result.to_arrow(["name", "category", "due"])
+    assert table.column("category").to_pylist() == ["A", "B", "A"]
+    assert str(table.column("due")[0]) == "2020-01-02 00:00:00"
+
+
+def test_aggregate():
+    pytest.importorskip("numpy")
+    rows = [("apple", 3, "A"), ("banana", None, "B"), ("cherry", 10, "A")]
+    result = get_local_query(rows).execute(local=True)
+    aggregations = [
+        {"id": "count", "aggregator": "count"},
+        {"id": "total", "property": "value", "aggregator": "sum"},
+        {"id": "mean", "property": "value", "aggregator": "average"},
+        {"id": "p50", "property": "value", "aggregator": "percentile"},
+        {"id": "names", "property": "name", "aggregator": "unique"},
+    ]
+
+    assert result.aggregate(aggregations) == {
+        "count": 3,
+        "total": 13,
+        "mean": 6.5,
+        "p50": 6.5,
+        "names": 3,
+    }
+    assert result.aggregate(aggregations, group_by="category") == {
+        "A": {"count": 2, "total": 13, "mean": 6.5, "p50": 6.5, "names": 2},
+        "B": {"count": 1, "total": 0, "mean": None, "p50": None, "names": 1},
+    }
+
+
+def test_schema_index():
+    collection = get_local_query([]).collection
+    store = collection._client._store
+    index = collection._get_schema_index()
+
+    assert collection.get_schema_property("title")["id"] == "title"
+    assert collection.get_schema_property("num")["slug"] == "value"
+    assert collection.get_schema_property("Category")["id"] == "sel"
+    assert collection.get_schema_property("category")["id"] == "sel"
+    assert collection.get_schema_property("missing") is None
+    assert collection._get_schema_index() is index
+
+    value = store._get("collection", collection.id)
+    schema = {**value["schema"], "new": {"name": "Other Thing", "type": "text"}}
+    store._update_record("collection", collection.id, {**value, "schema": schema})
+
+    assert collection._get_schema_index() is not index
+    assert collection.get_schema_property("other_thing")["id"] == "new"
+
+    # an equal schema in a new value is indexed once and then reused
+    value = {**store._get("collection", collection.id), "name": [["Renamed"]]}
+    store._update_record("collection", collection.id, deepcopy(value))
+    assert store._schema_indexes.get(collection.id) is None
+
+    index = collection._get_schema_index()
+    assert index["schema"] is store._get("collection", collection.id)["schema"]
+    assert collection._get_schema_index() is index
+
+
+def test_get_all_properties():
+    rows = [("apple", 3, "A"), ("banana", None, "B")]
+    result = get_local_query(rows).execute(local=True)
+
+    assert result.get_all_properties() == [
+        {"name": "apple", "value": 3, "category": "A"},
+        {"name": "banana", "value": None, "category": "B"},
+    ]
+    assert result.collection._get_row_reader() is result.collection._get_row_reader()
+
+
+def test_add_rows():
+    client = get_client()
+    collection = get_local_query([], client=client).collection
+
+    rows = collection.add_rows(
+        ({"name": f"row {i}", "value": i} for i in range(5)),
+        update_views=False,
+        batch_size=2,
+    )
+
+    assert [endpoint for endpoint, _ in client.requests] == ["submitTransaction"] * 3
+    assert [row.get_property("value") for row in rows] == [0, 1, 2, 3, 4]
+    assert rows[4].get_all_properties()["name"] == "row 4"
+    assert len(client._store.get_cached_collection_rows(COLLECTION_ID)) == 5
+
+
+def test_add_rows_rollback():
+    client = get_client()
+    collection = get_local_query([], client=client).collection
+    collection._get_a_collection_view = lambda: SimpleNamespace(
+        id="view", get=lambda path, default=None: IDS
+    )
+    view = collection.materialize()
+
+    def post(endpoint, data=None):
+        raise ConnectionError("offline")
+
+    client.post = post
+    with pytest.raises(ConnectionError):
+        collection.add_rows([{"name": "apple"}], update_views=False)
+
+    assert client._store.get_cached_collection_rows(COLLECTION_ID) == []
+    assert view.row_ids == []
+
+    with pytest.raises(TypeError):
+        collection.add_rows([{"value": "not a number"}], update_views=False)
+
+    assert client._store.get_cached_collection_rows(COLLECTION_ID) == []
+
+
+def test_upsert_rows():
+    client = get_client()
+    rows = [("apple", 3, "A"), ("banana", None, "B")]
+    collection = get_local_query(rows, client=client).collection
+
+    result = collection.upsert_rows(
+        [
+            {"name": "apple", "value": 3, "category": "A"},
+            {"name": "banana", "value": 7, "category": "B"},
+            {"name": "cherry", "value": 10},
+        ],
+        key="name",
+        update_views=False,
+        local=True,
+    )
+
+    assert [row.id for row in result["updated"]] == [IDS[1]]
+    assert [row.name for row in result["added"]] == ["cherry"]
+
+    # operations are sent with an "id" and then renamed for the local store
+    operations = client.requests[0][1]["operations"]
+    assert [op["path"] for op in operations if op["record_id"] == IDS[1]] == [
+        ["properties", "num"],
+        [],
+    ]
+    assert not [op for op in operations if op["record_id"] == IDS[0]]
+    assert result["updated"][0].value == 7
+
+
+def test_upsert_rows_matches_past_query_limit(monkeypatch):
+    monkeypatch.setattr("notion.store.QUERY_LIMIT", 1)
+    client = get_client()
+    rows = [("apple", 3, "A"), ("banana", None, "B")]
+    collection = get_local_query(rows, client=client).collection
+    collection._get_a_collection_view = lambda: SimpleNamespace(id="view")
+
+    def post(endpoint, data=None):
+        client.requests.append((endpoint, data))
+        block_ids = IDS[: data["loader"]["limit"]] if "loader" in data else []
+        result = {"blockIds": block_ids[:2], "total": 2}
+        return SimpleNamespace(json=lambda: {"result": result, "recordMap": {}})
+
+    client.post = post
+    rows = [
+        {"name": "banana", "value": 7, "icon": "🍌"},
+        {"name": "cherry", "icon": "🍒"},
+    ]
+    result = collection.upsert_rows(rows, key="name", update_views=False)
+
+    assert [row.id for row in result["updated"]] == [IDS[1]]
+    assert result["updated"][0].icon == "🍌"
+    assert result["added"][0].icon == "🍒"
+    assert [data["loader"]["limit"] for _, data in client.requests[:2]] == [1, 2]
+
+
+def test_select_options_are_batched():
+    client = get_client()
+    collection = get_local_query([], client=client).collection
+
+    collection.add_rows(
+        [{"category": c} for c in ("A", "b", "B", "C", "a")], update_views=False
+    )
+
+    operations = client.requests[0][1]["operations"]
+    schema_ops = [op for op in operations if op["path"] == ["schema"]]
+    assert len(schema_ops) == 1
+    assert operations[0] is schema_ops[0]
+
+    options = collection.get_schema_property("category")["options"]
+    assert [o["value"] for o in options] == ["A", "b", "C"]
+
+
+def test_prepared_query():
+    client = get_client()
+    query = get_local_query([("apple", 3, "A")], client=client)
+    response = {"result": {"type": "table", "blockIds": IDS[:1]}, "recordMap": {}}
+
+    def post(endpoint, data=None):
+        client.requests.append((endpoint, data))
+        return SimpleNamespace(json=lambda: response)
+
+    client.post = post
+    prepared = query.prepare(cache=True)
+
+    assert [row.id for row in prepared.execute()] == IDS[:1]
+    prepared.execute()
+    assert len(client.requests) == 1
+    assert isinstance(client.requests[0][1], bytes)
+
+    store = client._store
+    value = store._get("block", IDS[0])
+    store._update_record("block", IDS[0], {**value, "properties": {"title": [["x"]]}})
+
+    prepared.execute()
+    assert len(client.requests) == 2
+    assert client.requests[1][1] == client.requests[0][1]
+
+    # it shares the invalidation with the other cached queries
+    store.invalidate_query_cache(COLLECTION_ID)
+    prepared.execute()
+    assert len(client.requests) == 3
+
+
+def test_materialized_view():
+    rows = [("apple", 3, "A"), ("banana", None, "B"), ("cherry", 10, "A")]
+    collection = get_local_query(rows).collection
+    store = collection._client._store
+    collection._get_a_collection_view = lambda: SimpleNamespace(
+        id="view", get=lambda path, default=None: IDS
+    )
+
+    view = collection.materialize(
+        group_by="category",
+        sort=[{"property": "value", "direction": "descending"}],
+        aggregations=[{"property": "value", "aggregator": "sum", "id": "total"}],
+    )
+
+    assert view.row_ids == [IDS[2], IDS[0], IDS[1]]
+    assert view.groups == {"A": [IDS[2], IDS[0]], "B": [IDS[1]]}
+    assert view.get_aggregates("A") == {"total": 13}
+
+    value = store._get("block", IDS[1])
+    properties = {**value["properties"], "num": [["20"]], "sel": [["A"]]}
+    store._update_record("block", IDS[1], {**value, "properties": properties})
+
+    assert view.row_ids == [IDS[1], IDS[2], IDS[0]]
+    assert view.groups == {"A": [IDS[1], IDS[2], IDS[0]]}
+    assert view.get_aggregates("A") == {"total": 33}
+
+    store._update_record("block", IDS[2], {**store._get("block", IDS[2]), "alive": 0})
+    assert view.row_ids == [IDS[1], IDS[0]]
+
+    view.close()
+    store._update_record("block", IDS[0], {**store._get("block", IDS[0]), "alive": 0})
+    assert view.row_ids == [IDS[1], IDS[0]]
+
+
+def test_broken_materialized_view_does_not_stop_updates():
+    rows = [("apple", 3, "A"), ("banana", None, "B")]
+    collection = get_local_query(rows).collection
+    store = collection._client._store
+    collection._get_a_collection_view = lambda: SimpleNamespace(
+        id="view", get=lambda path, default=None: IDS
+    )
+
+    def callback(view):
+        raise ValueError("broken")
+
+    view = collection.materialize(callback=callback)
+    events = []
+    store.add_listener(events.append)
+
+    values = [store._get("block", i) for i in IDS[:2]]
+    store.store_record_map(
+        {
+            "recordMap": {
+                "block": {
+                    i: {"value": {**v, "properties": {"title": [["x"]]}}}
+                    for i, v in zip(IDS, values)
+                }
+            }
+        }
+    )
+
+    assert [store._get("block", i)["properties"] for i in IDS[:2]] == [
+        {"title": [["x"]]}
+    ] * 2
+    assert len(events) == 2
+    assert view.row_ids == IDS[:2]
+
+
+def test_path_filtered_callback():
+    rows = [("apple", 3, "A")]
+    collection = get_local_query(rows).collection
+    store = collection._client._store
+    row = CollectionRowBlock(collection._client, IDS[0])
+    calls = []
+    row.add_callback(lambda changes: calls.append(changes), paths=["value"])
+
+    value = store._get("block", IDS[0])
+    properties = {**value["properties"], "title": [["pear"]]}
+    store._update_record("block", IDS[0], {**value, "properties": properties})
+
+    properties = {**properties, "title": [["plum"]], "num": [["4"]]}
+    store._update_record("block", IDS[0], {**value, "properties": properties})
+
+    time.sleep(0.1)
+    assert calls == [[("prop_changed", "value", (3, 4))]]
@@ -0,0 +1,59 @@
+import asyncio
+import threading
+import time
+
+from notion.dispatcher import CallbackDispatcher
+
+
+def wait_for(dispatcher, timeout=5):
+    deadline = time.monotonic() + timeout
+    while dispatcher.stats["pending"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_callbacks_keep_order_per_key():
+    dispatcher = CallbackDispatcher(max_workers=4, max_pending=5)
+    calls = {"a": [], "b": []}
+
+    def callback(key, i):
+        time.sleep(0.001)
+        calls[key].append(i)
+
+    for i in range(20):
+        dispatcher.submit("a", callback, "a", i)
+        dispatcher.submit("b", callback, "b", i)
+
+    wait_for(dispatcher)
+    stats = dispatcher.stats
+
+    assert calls == {"a": list(range(20)), "b": list(range(20))}
+    assert stats["submitted"] == stats["completed"] == 40
+    assert stats["max_pending"] <= 5
+    assert len(dispatcher._workers) == 4
+
+
+def test_failures_are_counted():
+    dispatcher = CallbackDispatcher(max_workers=1)
+    dispatcher.submit("a", lambda: 1 / 0)
+    wait_for(dispatcher)
+
+    assert dispatcher.stats["failed"] == 1
+
+
+def test_asyncio_dispatch():
+    loop = asyncio.new_event_loop()
+    dispatcher = CallbackDispatcher(loop=loop)
+    calls = []
+
+    async def callback(i):
+        await asyncio.sleep(0)
+        calls.append((i, threading.current_thread()))
+
+    for i in range(3):
+        dispatcher.submit("a", callback, i)
+
+    loop.run_until_complete(asyncio.sleep(0.05))
+    loop.close()
+
+    assert [i for i, _ in calls] == [0, 1, 2]
+    assert {t for _, t in calls} == {threading.current_thread()}
@@ -0,0 +1,91 @@
+import asyncio
+import threading
+
+from notion.events import EventStream, RecordChanged, RowAdded, RowRemoved
+from notion.store import RecordStore
+
+A = "11111111-1111-1111-1111-111111111111"
+B = "22222222-2222-2222-2222-222222222222"
+
+
+def get_store():
+    store = RecordStore(client=None)
+    store._update_record("block", A, {"id": A, "title": "a"})
+    store.set_collection_rows(B, [])
+    return store
+
+
+def test_event_stream():
+    store = get_store()
+    events = EventStream(store)
+
+    store._update_record("block", A, {"id": A, "title": "b"})
+    store.set_collection_rows(B, [A])
+    events.close()
+
+    assert list(events) == [
+        RecordChanged(
+            "block",
+            A,
+            [("change", "title", ("a", "b"))],
+            {"id": A, "title": "a"},
+            {"id": A, "title": "b"},
+        ),
+        RowAdded(B, A),
+    ]
+
+
+def test_event_stream_policies():
+    store = get_store()
+    dropping = EventStream(store, maxsize=1, policy="drop_oldest")
+    merging = EventStream(store, maxsize=1, policy="merge")
+
+    for title in ("b", "c", "a"):
+        store._update_record("block", A, {"id": A, "title": title})
+    store.set_collection_rows(B, [A])
+    store.set_collection_rows(B, [])
+
+    assert dropping.get(timeout=0) == RowRemoved(B, A)
+    assert dropping.stats["dropped"] == 4
+
+    # the title went back to "a" and the row was removed again
+    assert merging.get(timeout=0) is None
+    assert merging.stats["merged"] == 3
+
+
+def test_event_stream_blocks_and_iterates_async():
+    store = get_store()
+    events = EventStream(store, maxsize=1, policy="block")
+
+    def produce():
+        for title in ("b", "c", "d"):
+            store._update_record("block", A, {"id": A, "title": title})
+        events.close()
+
+    async def consume():
+        thread = threading.Thread(target=produce)
+        thread.start()
+        titles = [event.new_val["title"] async for event in events]
+        thread.join()
+        return titles
+
+    loop = asyncio.new_event_loop()
+    assert loop.run_until_complete(consume()) == ["b", "c", "d"]
+    loop.close()
+    assert events.stats["delivered"] == 3
+
+
+def test_event_stream_does_not_block_its_consumer():
+    store = get_store()
+    ignored = EventStream(store, maxsize=1)
+    events = EventStream(store, maxsize=1, policy="block")
+
+    store._update_record("block", A, {"id": A, "title": "b"})
+    assert events.get(timeout=0).new_val["title"] == "b"
+
+    # the consumer writes back, nothing is draining the first stream either
+    for title in ("c", "d"):
+        store._update_record("block", A, {"id": A, "title": title})
+
+    assert [events.get(timeout=0).new_val["title"] for _ in range(2)] == ["c", "d"]
+    assert ignored.stats["dropped"] == 2
@@ -0,0 +1,59 @@
+import time
+from types import SimpleNamespace
+
+from notion.hub import HubMonitor, MonitorHub
+from notion.store import RecordStore
+
+A = "11111111-1111-1111-1111-111111111111"
+C = "44444444-4444-4444-4444-444444444444"
+
+
+def get_client(**kwargs):
+    session = SimpleNamespace(cookies={"token_v2": "token"})
+    return SimpleNamespace(_store=RecordStore(None), session=session, **kwargs)
+
+
+def wait_for(condition):
+    for _ in range(100):
+        if condition():
+            return
+        time.sleep(0.01)
+    raise AssertionError("Timed out")
+
+
+def test_hub_broadcasts_changes(tmp_path):
+    address = str(tmp_path / "hub.sock")
+
+    # the hub doesn't have to be running yet
+    worker = get_client()
+    worker._store._update_record("block", A, {"id": A, "version": 1})
+    worker._store.set_collection_rows(C, [])
+    monitor = HubMonitor(worker, address=address)
+    monitor.subscribe(SimpleNamespace(_table="block", id=A))
+    monitor.subscribe(SimpleNamespace(_table="collection", id=C))
+
+    subscribed = []
+    client = get_client(
+        _monitor=SimpleNamespace(subscribe=subscribed.extend),
+        start_monitoring=lambda: None,
+        refresh_records=lambda **kwargs: subscribed.append(kwargs),
+    )
+    store = client._store
+    MonitorHub(client, address=address).start()
+
+    # both subscriptions are sent at once and the hub trusts their versions
+    monitor.initialize()
+    wait_for(lambda: len(subscribed) == 2)
+    assert [(r._table, r.id, r.get("version")) for r in subscribed] == [
+        ("block", A, 1),
+        ("collection", C, -1),
+    ]
+
+    store._update_record("block", A, {"id": A, "version": 2, "title": "b"})
+    monitor.poll()
+    assert worker._store._get("block", A)["title"] == "b"
+
+    store.set_collection_rows(C, [])
+    store.set_collection_rows(C, [A])
+    monitor.poll()
+    assert worker._store.get_collection_rows(C) == [A]
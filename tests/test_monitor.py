@@ -0,0 +1,156 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from notion.monitor import Monitor
+from notion.store import RecordStore
+
+OPEN = '0{"sid":"abc","upgrades":["websocket"],"pingInterval":25000}'
+HANDSHAKE = f"{len(OPEN)}:{OPEN}".encode()
+
+
+class FakeWebSocket:
+    def __init__(self, frames):
+        self.frames = list(frames)
+        self.sent = []
+        self.closed = False
+
+    def send(self, data):
+        self.sent.append(data)
+
+    def recv(self):
+        return self.frames.pop(0)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeRecord:
+    id = "abc"
+    _table = "block"
+
+    def get(self, path, default=None):
+        return 1
+
+
+def get_monitor(monkeypatch, frames, transport="websocket", store=None):
+    session = SimpleNamespace(
+        get=lambda url: SimpleNamespace(content=HANDSHAKE),
+        post=lambda url, data: posts.append(data),
+        cookies=SimpleNamespace(get_dict=lambda: {}),
+    )
+    posts = []
+    store = store or SimpleNamespace(_cache_key=None)
+    client = SimpleNamespace(session=session, refreshed=[], _store=store)
+    client.refresh_records = lambda **kwargs: client.refreshed.append(kwargs)
+
+    websocket = FakeWebSocket(frames)
+    # the connection is made while initializing, patch it in before that
+    monitor = Monitor.__new__(Monitor)
+    monkeypatch.setattr(monitor, "_create_websocket", lambda url: websocket)
+    monitor.__init__(client, transport=transport)
+
+    return monitor, websocket, posts
+
+
+def test_websocket_transport(monkeypatch):
+    pytest.importorskip("websocket")
+    notification = {"type": "notification", "key": "versions/abc:block", "value": 2}
+    monitor, websocket, posts = get_monitor(
+        monkeypatch, ["3probe", '4"primus::ping::1"', "4" + json.dumps(notification)]
+    )
+
+    assert monitor._websocket is websocket
+    assert websocket.sent == ["2probe", "5"]
+
+    monitor.subscribe([FakeRecord(), FakeRecord()])
+    monitor.subscribe(FakeRecord())
+    assert websocket.sent == ["2probe", "5"]
+
+    monitor.flush_subscriptions()
+    assert len(websocket.sent) == 3
+    assert json.loads(websocket.sent[-1][1:])["key"] == "versions/abc:block"
+
+    monitor.poll()
+    assert websocket.sent[-1] == '4"primus::pong::1"'
+
+    monitor.client._store = SimpleNamespace(
+        _cache_key=None, get_current_version=lambda **_: 1
+    )
+    monitor.poll()
+    assert monitor.client.refreshed[-1] == {"block": ["abc"]}
+    assert not posts
+
+
+def test_websocket_falls_back_to_polling(monkeypatch):
+    monitor, websocket, _ = get_monitor(monkeypatch, ["40"])
+
+    assert monitor._websocket is None
+    assert websocket.closed
+
+
+def test_collection_notifications_are_coalesced(monkeypatch):
+    monitor, _, _ = get_monitor(monkeypatch, [], transport="polling")
+    refreshed = []
+    invalidated = []
+    monitor.client.refresh_collection_rows = refreshed.append
+    monitor.client._store.invalidate_query_cache = invalidated.append
+
+    events = [
+        {"type": "notification", "key": "collection/abc", "value": 1},
+        {"type": "notification", "key": "collection/abc", "value": 2},
+        {"type": "notification", "key": "collection/def", "value": 1},
+    ]
+    monitor._refresh_updated_records(events)
+    monitor._refresh_updated_records(events[:1])
+    assert not refreshed
+    assert invalidated == ["abc", "abc", "def", "abc"]
+
+    monitor.refresh_collections()
+    assert sorted(refreshed) == ["abc", "def"]
+
+
+def test_payload_parser_handles_partial_frames(monkeypatch):
+    monitor, _, posts = get_monitor(monkeypatch, [], transport="polling")
+    message = {"type": "notification", "key": "versions/a:block", "value": "😀 ą"}
+    packet = "4" + json.dumps(message, ensure_ascii=False)
+    payload = monitor._encode_packets([packet, packet, '4"primus::ping::1"'])
+
+    # feed it byte by byte, splitting also the multibyte characters
+    chunks = [payload[i : i + 1] for i in range(len(payload))]
+    results = [
+        r for chunk in chunks for r in monitor._decode_numbered_json_thing(chunk)
+    ]
+
+    assert results == [message, message]
+    assert posts == [b'18:4"primus::pong::1"']
+
+
+def test_subscriptions_are_checkpointed(monkeypatch, tmp_path):
+    monkeypatch.setattr("notion.store.NOTION_CACHE_DIR", str(tmp_path))
+    store = RecordStore(None, cache_key="key")
+
+    monitor, _, _ = get_monitor(monkeypatch, [], transport="polling", store=store)
+    monitor.subscribe(FakeRecord())
+    monitor.flush_subscriptions()
+    monitor.checkpoint()
+
+    # after a restart the record is subscribed again with the last seen version
+    monitor, _, posts = get_monitor(monkeypatch, [], transport="polling", store=store)
+    subscription = json.loads(monitor._parser.feed(posts[0])[0][1:])
+    assert subscription["key"] == "versions/abc:block"
+    assert subscription["version"] == 1
+
+    notifications = [
+        {"type": "notification", "key": "versions/abc:block", "value": 1},
+        {"type": "notification", "key": "versions/abc:block", "value": 2},
+    ]
+    monitor._refresh_updated_records(notifications[:1])
+    monitor._refresh_updated_records(notifications[1:])
+    assert monitor.client.refreshed == [{}, {"block": ["abc"]}]
+    assert monitor._checkpoint == {"block/abc": 2}
+    assert monitor._subscriptions["block", "abc"].get("title") is None
+
+    monitor.checkpoint()
+    assert monitor._checkpoint_timer is None
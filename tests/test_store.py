@@ -0,0 +1,166 @@
+import time
+from types import SimpleNamespace
+
+from notion.store import Missing, RecordStore
+
+A = "11111111-1111-1111-1111-111111111111"
+B = "22222222-2222-2222-2222-222222222222"
+C = "33333333-3333-3333-3333-333333333333"
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+class FakeClient:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def in_transaction(self):
+        return False
+
+    def post(self, endpoint, data=None):
+        self.requests.append((endpoint, data))
+        return FakeResponse(self.responses.pop(0))
+
+
+def block(block_id, **kwargs):
+    return {"role": "editor", "value": {"id": block_id, "version": 1, **kwargs}}
+
+
+def test_iter_load_page_chunk_follows_cursor():
+    client = FakeClient(
+        [
+            {
+                "recordMap": {"block": {A: block(A), B: block(B)}},
+                "cursor": {"stack": [[{"table": "block", "id": B, "index": 0}]]},
+            },
+            {
+                "recordMap": {"block": {C: block(C)}},
+                "cursor": {"stack": []},
+            },
+        ]
+    )
+    store = RecordStore(client)
+
+    chunks = list(store.iter_load_page_chunk(A, limit=2))
+
+    assert chunks == [[A, B], [C]]
+    assert [r[1]["chunkNumber"] for r in client.requests] == [0, 1]
+    assert [r[1]["limit"] for r in client.requests] == [2, 2]
+    assert client.requests[1][1]["cursor"]["stack"][0][0]["id"] == B
+    assert store.get("block", C)["id"] == C
+
+
+def test_iter_query_collection_pages_through_rows():
+    blocks = {i: block(i, parent_table="collection") for i in (A, B, C)}
+    client = FakeClient(
+        [
+            {"recordMap": {"block": blocks}, "result": {"blockIds": [A, B, C]}},
+            {"results": [blocks[C]]},
+        ]
+    )
+    store = RecordStore(client)
+
+    pages = store.iter_query_collection(2, collection_id=A, collection_view_id=B)
+
+    assert next(pages)[0] == [A, B]
+    assert store._get("block", C) is Missing
+    assert next(pages)[0] == [C]
+    assert [endpoint for endpoint, _ in client.requests] == [
+        "queryCollection",
+        "getRecordValues",
+    ]
+    assert client.requests[1][1]["requests"] == [{"table": "block", "id": C}]
+    assert store._get("block", C)["id"] == C
+
+
+def test_iter_query_collection_goes_past_query_limit(monkeypatch):
+    monkeypatch.setattr("notion.store.QUERY_LIMIT", 2)
+    blocks = {i: block(i, parent_table="collection") for i in (A, B, C)}
+    client = FakeClient(
+        [
+            {
+                "recordMap": {"block": blocks},
+                "result": {"blockIds": [A, B], "total": 3},
+            },
+            {
+                "recordMap": {"block": blocks},
+                "result": {"blockIds": [A, B, C], "total": 3},
+            },
+            {"results": [blocks[C]]},
+        ]
+    )
+    store = RecordStore(client)
+
+    pages = store.iter_query_collection(2, collection_id=A, collection_view_id=B)
+
+    assert [ids for ids, _ in pages] == [[A, B], [C]]
+    assert [data["loader"]["limit"] for _, data in client.requests[:2]] == [2, 3]
+    assert client.requests[2][1]["requests"] == [{"table": "block", "id": C}]
+
+
+def test_query_collection_cache():
+    def result(*ids):
+        blocks = {i: block(i, parent_table="collection", parent_id=C) for i in ids}
+        return {"recordMap": {"block": blocks}, "result": {"blockIds": list(ids)}}
+
+    client = FakeClient([result(A), result(A, B), result(A, B)])
+    store = RecordStore(client)
+    query = {"collection_id": C, "collection_view_id": C, "use_cache": True}
+
+    assert store.call_query_collection(**query)["blockIds"] == [A]
+    assert store.call_query_collection(**query)["blockIds"] == [A]
+    assert len(client.requests) == 1
+
+    # changes of the rows bump the collection version
+    store._update_record("block", A, {**store._get("block", A), "alive": False})
+    assert store.call_query_collection(**query)["blockIds"] == [A, B]
+    assert len(client.requests) == 2
+
+    store.invalidate_query_cache(C)
+    store.call_query_collection(**query)
+    assert len(client.requests) == 3
+
+
+def test_store_record_map_only_newer():
+    store = RecordStore(FakeClient([]))
+    store._update_record("block", A, {"id": A, "version": 2, "title": "old"})
+
+    data = {"recordMap": {"block": {A: block(A, version=2, title="new")}}}
+    store.store_record_map(data, only_newer=True)
+    assert store._get("block", A)["title"] == "old"
+
+    data["recordMap"]["block"][A]["value"]["version"] = 3
+    store.store_record_map(data, only_newer=True)
+    assert store._get("block", A)["title"] == "new"
+
+
+def test_coalesced_callback():
+    store = RecordStore(FakeClient([]))
+    calls = []
+
+    for record_id in (A, B):
+        record = SimpleNamespace(
+            _table="block",
+            id=record_id,
+            _convert_diff_to_changelist=lambda *args: [],
+        )
+        store.add_callback(
+            record, lambda difference: calls.append(difference), coalesce=0.05
+        )
+
+    for title in ("a", "b", "c"):
+        store._update_record("block", A, {"id": A, "title": title})
+
+    # the title of B goes back and forth, so there's no net change
+    for title in ("a", "b", "a"):
+        store._update_record("block", B, {"id": B, "title": title})
+
+    time.sleep(0.2)
+    assert calls == [[("change", "title", ("a", "c"))]]